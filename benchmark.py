@@ -0,0 +1,178 @@
+"""Frame-time benchmark for the render pipeline.
+
+Drives the same World / Effects / Renderer pipeline as main() offscreen with
+SDL's dummy video driver through scripted scenarios, and writes per-stage
+p50/p95/p99 timings in milliseconds to a JSON file that can be diffed
+between commits.
+
+    python benchmark.py --frames 600 --out bench.json
+    python benchmark.py --scenario wall_heavy,impact_frames
+    python benchmark.py --render-scale 50
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import numpy as np
+import pygame
+
+import wizard_rush as wr
+
+
+FRAME_DT = 1.0 / wr.FPS
+FLOAT_Y = 150.0
+
+
+def float_player(world):
+    """Park the wizard above the tallest wall so dense scenarios never end."""
+    world.gravity = 0.0
+    world.player_y = world.prev_player_y = FLOAT_Y
+
+
+class Scenario:
+    """One scripted workload: a world setup plus a per-frame hook."""
+
+    def __init__(self, name, state=wr.STATE_PLAYING, policy=None, setup=None, every_frame=None, **tuning):
+        self.name = name
+        self.state = state
+        self.policy = policy
+        self.setup = setup
+        self.every_frame = every_frame
+        self.tuning = tuning
+
+
+def cast_every(seconds):
+    def hook(world, fx, frame):
+        if frame % max(1, round(seconds * wr.FPS)) == 0:
+            world.cast_spell()
+    return hook
+
+
+def impact_every(seconds):
+    def hook(world, fx, frame):
+        if frame % max(1, round(seconds * wr.FPS)) == 0:
+            fx.trigger_impact_vfx(wr.PLAYER_X + 300, wr.GROUND_Y - 40, (205, 170, 255), 1.0)
+    return hook
+
+
+SCENARIOS = [
+    Scenario("menu_idle", state=wr.STATE_MENU),
+    Scenario("long_run", policy=wr.autopilot, difficulty="Easy"),
+    Scenario("wall_heavy", setup=float_player, wall_chance=1.0, spawn_interval=0.3),
+    Scenario("spell_bursts", setup=float_player, every_frame=cast_every(0.2), spawn_interval=0.25),
+    Scenario("impact_frames", policy=wr.autopilot, every_frame=impact_every(0.15), difficulty="Easy"),
+]
+
+
+def percentiles(samples):
+    ms = np.asarray(samples) * 1000.0
+    return {
+        "p50": round(float(np.percentile(ms, 50)), 4),
+        "p95": round(float(np.percentile(ms, 95)), 4),
+        "p99": round(float(np.percentile(ms, 99)), 4),
+        "mean": round(float(ms.mean()), 4),
+    }
+
+
+def run_scenario(renderer, scenario, frames, fx_level, seed):
+    random.seed(seed)
+    fx = wr.Effects(fx_level, wr.ParticleSystem(seed=seed))
+    wr.WIZARD_SPRITES.set_fx_level(fx_level)
+    world = wr.World(seed=seed, fx=fx, **scenario.tuning)
+    if scenario.setup:
+        scenario.setup(world)
+    menu_buttons = [
+        wr.Button(wr.WIDTH // 2 - 140, 360 + i * 76, 280, 62, label, lambda: None)
+        for i, label in enumerate(("Start Run", "Settings", "Quit"))
+    ]
+
+    def draw_hud():
+        renderer.draw_hud(world.score, 0)
+
+    timings = {}
+    accumulator = 0.0
+    for frame in range(1, frames + 1):
+        started = time.perf_counter()
+        if scenario.every_frame:
+            scenario.every_frame(world, fx, frame)
+        if scenario.state == wr.STATE_PLAYING:
+            fx.update_timers(FRAME_DT)
+            accumulator += FRAME_DT
+            while accumulator >= wr.SIM_DT:
+                if scenario.policy:
+                    for action in scenario.policy(world):
+                        wr.apply_input(world, action)
+                world.step(wr.SIM_DT)
+                accumulator -= wr.SIM_DT
+                if not world.alive:
+                    world.reset(seed=seed + frame)
+                    if scenario.setup:
+                        scenario.setup(world)
+        fx.particles.update(FRAME_DT)
+        timings.setdefault("update", []).append(time.perf_counter() - started)
+
+        alpha = accumulator / wr.SIM_DT
+        if scenario.state == wr.STATE_PLAYING:
+            renderer.render_frame(world, fx, alpha, frame, draw_hud, timings)
+        else:
+            # Hover over a different button every half second.
+            mouse_pos = menu_buttons[(frame // 30) % len(menu_buttons)].rect.center
+            renderer.render_ui(world, fx, alpha, frame, "WIZARD RUSH", "Press ENTER/SPACE or click Start", menu_buttons, mouse_pos, timings)
+        timings.setdefault("frame", []).append(time.perf_counter() - started)
+
+    result = {stage: percentiles(samples) for stage, samples in timings.items()}
+    result["frames"] = frames
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark Wizard Rush frame stages offscreen.")
+    parser.add_argument("--frames", type=int, default=600, help="frames per scenario")
+    parser.add_argument("--scenario", help="comma-separated scenario names (default: all)")
+    parser.add_argument("--fx", default="High", choices=("Low", "Medium", "High"))
+    parser.add_argument("--render-scale", type=int, default=100, choices=[round(s * 100) for s in wr.RENDER_SCALES], help="world resolution in percent")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", default="bench.json")
+    args = parser.parse_args(argv)
+
+    wanted = set(args.scenario.split(",")) if args.scenario else None
+    pygame.init()
+    screen = pygame.display.set_mode((wr.WIDTH, wr.HEIGHT))
+    renderer = wr.Renderer(screen, render_scale=args.render_scale / 100)
+    wr.AssetLoader(renderer).load()
+
+    report = {
+        "meta": {
+            "pygame": pygame.version.ver,
+            "sdl": ".".join(map(str, pygame.get_sdl_version())),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "fx": args.fx,
+            "render_scale": args.render_scale,
+            "frames": args.frames,
+        },
+        "scenarios": {},
+    }
+    for scenario in SCENARIOS:
+        if wanted and scenario.name not in wanted:
+            continue
+        result = run_scenario(renderer, scenario, args.frames, args.fx, args.seed)
+        report["scenarios"][scenario.name] = result
+        frame = result["frame"]
+        print(f"{scenario.name:<14} frame p50 {frame['p50']:7.3f} ms  p95 {frame['p95']:7.3f} ms  p99 {frame['p99']:7.3f} ms")
+
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print(f"-> {args.out}")
+    pygame.quit()
+
+
+if __name__ == "__main__":
+    main()
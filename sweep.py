@@ -0,0 +1,132 @@
+"""Parameter sweep for difficulty tuning.
+
+Spreads headless autopilot runs over a process pool and streams one CSV row
+per run as batches finish. Every comma-separated option is one sweep axis;
+the sweep covers their full cartesian product for each difficulty.
+
+    python sweep.py --difficulty Easy,Normal,Hard --gravity 1350,1500,1650 \
+        --runs 2000 --max-time 120 --out sweep.csv
+"""
+
+import argparse
+import csv
+import itertools
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from wizard_rush import SIM_DT, SPEED_PROFILE, World, run_batch
+
+
+PARAMS = ("speed", "spawn_interval", "gravity", "jump_force", "long_jump_window", "wall_chance")
+COLUMNS = ("difficulty",) + PARAMS + ("seed", "run", "score", "survived", "alive", "hit_wall", "spells_cast")
+
+
+def parse_axis(text, cast=float):
+    if text is None:
+        return [None]
+    return [cast(v) for v in text.split(",") if v.strip()]
+
+
+def run_task(difficulty, params, seed, runs, max_time):
+    """Worker entry point: one batch of runs for one grid point."""
+    tuning = {k: v for k, v in params.items() if v is not None}
+    batch = run_batch(runs, seed=seed, difficulty=difficulty, max_time=max_time, **tuning)
+    reference = World(difficulty, **tuning)
+    resolved = {name: getattr(reference, name) for name in PARAMS}
+    survived = np.where(batch.alive, batch.time, batch.death_time)
+    return {
+        "difficulty": difficulty,
+        "params": resolved,
+        "seed": seed,
+        "score": batch.score.astype(np.int64),
+        "survived": survived,
+        "alive": batch.alive,
+        "hit_wall": batch.hit_wall,
+        "spells_cast": batch.spells_cast,
+    }
+
+
+def write_rows(writer, result):
+    params = [result["params"][p] for p in PARAMS]
+    for i in range(result["score"].size):
+        writer.writerow(
+            [result["difficulty"], *params, result["seed"], i]
+            + [
+                int(result["score"][i]),
+                round(float(result["survived"][i]), 4),
+                int(result["alive"][i]),
+                int(result["hit_wall"][i]),
+                int(result["spells_cast"][i]),
+            ]
+        )
+
+
+def survival_summary(results, swept, checkpoints):
+    """Fraction of runs still alive at each checkpoint, per difficulty and swept values."""
+    groups = {}
+    for result in results:
+        label = " ".join([f"{result['difficulty']:<7}"] + [f"{p}={result['params'][p]:g}" for p in swept])
+        groups.setdefault(label, []).append(result["survived"])
+    lines = []
+    for label, chunks in sorted(groups.items()):
+        survived = np.concatenate(chunks)
+        curve = "  ".join(f"{t:g}s={np.mean(survived >= t - SIM_DT / 2) * 100:5.1f}%" for t in checkpoints)
+        lines.append(f"{label}  n={survived.size}  {curve}")
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sweep Wizard Rush tuning over headless autopilot runs.")
+    parser.add_argument("--difficulty", default="Easy,Normal,Hard")
+    for name in PARAMS:
+        parser.add_argument("--" + name.replace("_", "-"), dest=name, help="comma-separated values (default: game value)")
+    parser.add_argument("--runs", type=int, default=1000, help="runs per grid point and difficulty")
+    parser.add_argument("--batch", type=int, default=2000, help="runs per worker task")
+    parser.add_argument("--max-time", type=float, default=120.0, help="simulated seconds per run")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("--seed", type=int, default=0, help="base seed")
+    parser.add_argument("--out", default="sweep.csv")
+    args = parser.parse_args(argv)
+
+    difficulties = parse_axis(args.difficulty, str)
+    axes = [parse_axis(getattr(args, name)) for name in PARAMS]
+    grid = [dict(zip(PARAMS, values)) for values in itertools.product(*axes)]
+
+    tasks = []
+    for difficulty in difficulties:
+        if difficulty not in SPEED_PROFILE:
+            parser.error(f"unknown difficulty {difficulty!r}")
+        for params in grid:
+            for start in range(0, args.runs, args.batch):
+                tasks.append((difficulty, params, args.seed + len(tasks), min(args.batch, args.runs - start), args.max_time))
+
+    started = time.perf_counter()
+    results = []
+    with open(args.out, "w", newline="") as f, ProcessPoolExecutor(max_workers=args.workers) as pool:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        futures = [pool.submit(run_task, *task) for task in tasks]
+        for done, future in enumerate(as_completed(futures), 1):
+            result = future.result()
+            write_rows(writer, result)
+            f.flush()
+            result.pop("score")
+            results.append(result)
+            print(f"\r{done}/{len(tasks)} batches", end="", file=sys.stderr, flush=True)
+    print(file=sys.stderr)
+
+    elapsed = time.perf_counter() - started
+    total = sum(r["survived"].size for r in results)
+    print(f"{total} runs in {elapsed:.1f}s -> {args.out}")
+    swept = [name for name in PARAMS if getattr(args, name) is not None]
+    checkpoints = sorted({t for t in (10, 30, 60) if t < args.max_time} | {args.max_time})
+    for line in survival_summary(results, swept, checkpoints):
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,20 @@
+import argparse
+import contextlib
+import hashlib
+import json
 import math
+import os
+import queue
 import random
+import sqlite3
+import struct
 import sys
+import threading
+import time
+import zlib
+from collections import OrderedDict, deque
 
+import numpy as np
 import pygame
 
 
@@ -16,11 +29,36 @@ STATE_PAUSED = "paused"
 STATE_SETTINGS = "settings"
 STATE_GAME_OVER = "game_over"
 
+PARTICLE_CAPACITY = 2048
+
+SIM_HZ = 120
+SIM_DT = 1.0 / SIM_HZ
+MAX_FRAME_TIME = 0.25
+
+# Fractions of the window the world layers are drawn at; the HUD and menus always draw at full size.
+RENDER_SCALES = (1.0, 0.75, 0.5)
+
 
 def clamp(value, low, high):
     return max(low, min(high, value))
 
 
+def scale_rect(x, y, w, h, scale):
+    """Map a rect from logical coordinates onto a target drawn at scale, rounding edges not sizes."""
+    left, top = round(x * scale), round(y * scale)
+    return pygame.Rect(left, top, round((x + w) * scale) - left, round((y + h) * scale) - top)
+
+
+SINE_TABLE_SIZE = 4096
+SINE_TABLE = [math.sin(i * math.tau / SINE_TABLE_SIZE) for i in range(SINE_TABLE_SIZE)]
+SINE_SCALE = SINE_TABLE_SIZE / math.tau
+
+
+def table_sin(angle):
+    """Sine from SINE_TABLE, within 0.002 of math.sin; for animation, not gameplay."""
+    return SINE_TABLE[int(angle * SINE_SCALE) % SINE_TABLE_SIZE]
+
+
 class Button:
     def __init__(self, x, y, w, h, label, action):
         self.rect = pygame.Rect(x, y, w, h)
@@ -36,7 +74,7 @@ class Button:
         shine = pygame.Rect(self.rect.x + 4, self.rect.y + 4, self.rect.w - 8, 14)
         pygame.draw.rect(surface, (185, 210, 255), shine, border_radius=8)
         pygame.draw.rect(surface, (150, 180, 255), self.rect, 2, border_radius=16)
-        text = font.render(self.label, True, (240, 246, 255))
+        text = TEXT_CACHE.render(font, self.label, (240, 246, 255))
         surface.blit(text, text.get_rect(center=self.rect.center))
 
     def click(self, pos):
@@ -55,135 +93,2610 @@ def draw_vertical_gradient(surface, top_color, bottom_color):
         pygame.draw.line(surface, (r, g, b), (0, y), (surface.get_width(), y))
 
 
-def draw_soft_glow(surface, center, radius, color, alpha):
-    glow = pygame.Surface((radius * 2, radius * 2), pygame.SRCALPHA)
-    for i in range(5, 0, -1):
-        r = int(radius * i / 5)
-        a = int(alpha * i / 5 * 0.35)
-        pygame.draw.circle(glow, (*color, a), (radius, radius), r)
-    surface.blit(glow, (center[0] - radius, center[1] - radius))
+class GlowCache:
+    """Bounded LRU of pre-rendered glow sprites keyed by (radius, color, alpha).
+
+    scale shrinks every glow radius; the quality governor lowers it on slow
+    machines, where the big alpha blits are a large share of the frame.
+    """
+
+    def __init__(self, capacity=48):
+        self.capacity = capacity
+        self.scale = 1.0
+        self.sprites = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, radius, color, alpha, quantize=1):
+        if quantize > 1:
+            radius = max(quantize, -(-radius // quantize) * quantize)
+        key = (radius, tuple(color), alpha)
+        sprite = self.sprites.get(key)
+        if sprite is not None:
+            self.hits += 1
+            self.sprites.move_to_end(key)
+            return sprite
+
+        self.misses += 1
+        return self.put(key, self.render(radius, color, alpha))
+
+    def put(self, key, sprite):
+        self.sprites[key] = sprite
+        while len(self.sprites) > self.capacity:
+            self.sprites.popitem(last=False)
+        return sprite
+
+    @staticmethod
+    def render(radius, color, alpha):
+        sprite = pygame.Surface((radius * 2, radius * 2), pygame.SRCALPHA)
+        for i in range(5, 0, -1):
+            r = int(radius * i / 5)
+            a = int(alpha * i / 5 * 0.35)
+            pygame.draw.circle(sprite, (*color, a), (radius, radius), r)
+        return sprite
+
+    def clear(self):
+        self.sprites.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+GLOW_CACHE = GlowCache()
+
+
+def draw_soft_glow(surface, center, radius, color, alpha, quantize=1):
+    if GLOW_CACHE.scale != 1.0:
+        radius = max(1, int(radius * GLOW_CACHE.scale))
+    glow = GLOW_CACHE.get(radius, color, alpha, quantize)
+    half = glow.get_width() // 2
+    surface.blit(glow, (center[0] - half, center[1] - half))
+
+
+class TextCache:
+    """Bounded LRU of rendered text surfaces keyed by (font, text, color)."""
+
+    def __init__(self, capacity=128):
+        self.capacity = capacity
+        self.surfaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, font, text, color):
+        key = (font, text, tuple(color))
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.hits += 1
+            self.surfaces.move_to_end(key)
+            return surface
+
+        self.misses += 1
+        surface = font.render(text, True, color)
+        self.surfaces[key] = surface
+        while len(self.surfaces) > self.capacity:
+            self.surfaces.popitem(last=False)
+        return surface
+
+    def clear(self):
+        self.surfaces.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+TEXT_CACHE = TextCache()
+
+
+class DigitAtlas:
+    """Pre-rendered 0-9 glyphs so changing numbers are drawn without rasterizing text."""
+
+    def __init__(self, font, color):
+        self.glyphs = [font.render(str(d), True, color) for d in range(10)]
+
+    def draw(self, surface, number, pos):
+        x, y = pos
+        blits = []
+        for ch in str(int(number)):
+            glyph = self.glyphs[ord(ch) - 48]
+            blits.append((glyph, (x, y)))
+            x += glyph.get_width()
+        surface.blits(blits, doreturn=False)
+        return x
+
+
+class SkyLayerCache:
+    """Bakes the static sky (gradient, moon, sunset band, tint) once per size and palette."""
+
+    def __init__(self):
+        self.layers = {}
+
+    @staticmethod
+    def key(size, top_color, bottom_color, band_color=(255, 136, 92), tint=(12, 16, 38, 168)):
+        return (tuple(size), tuple(top_color), tuple(bottom_color), tuple(band_color), tuple(tint))
+
+    def get(self, size, top_color, bottom_color, band_color=(255, 136, 92), tint=(12, 16, 38, 168)):
+        key = self.key(size, top_color, bottom_color, band_color, tint)
+        layer = self.layers.get(key)
+        if layer is None:
+            layer = self.install(key, self.render(*key))
+        return layer
+
+    def install(self, key, layer):
+        if pygame.display.get_surface() is not None:
+            layer = layer.convert()
+        self.layers[key] = layer
+        return layer
+
+    @staticmethod
+    def render(size, top_color, bottom_color, band_color, tint):
+        w, h = size
+        sx, sy = w / WIDTH, h / HEIGHT
+        layer = pygame.Surface((w, h))
+        draw_vertical_gradient(layer, top_color, bottom_color)
+        moon = (int(1080 * sx), int(105 * sy))
+        glow_r = int(124 * sx)
+        layer.blit(GlowCache.render(glow_r, (140, 195, 255), 120), (moon[0] - glow_r, moon[1] - glow_r))
+        pygame.draw.circle(layer, (232, 245, 255), moon, int(56 * sx))
+        pygame.draw.circle(layer, (138, 185, 255), moon, int(84 * sx), 2)
+        pygame.draw.rect(layer, band_color, (0, int(250 * sy), w, int(180 * sy)))
+        overlay = pygame.Surface((w, h), pygame.SRCALPHA)
+        overlay.fill(tint)
+        layer.blit(overlay, (0, 0))
+        return layer
+
+    def clear(self):
+        self.layers.clear()
+
+
+class ParticleSystem:
+    """Structure-of-arrays particle pool integrated in one vectorized pass."""
+
+    def __init__(self, capacity=PARTICLE_CAPACITY, seed=None):
+        self.capacity = capacity
+        self.limit = capacity
+        self.count = 0
+        self.rng = np.random.default_rng(seed)
+        self.x = np.zeros(capacity, np.float64)
+        self.y = np.zeros(capacity, np.float64)
+        self.vx = np.zeros(capacity, np.float64)
+        self.vy = np.zeros(capacity, np.float64)
+        self.life = np.zeros(capacity, np.float64)
+        self.max_life = np.zeros(capacity, np.float64)
+        self.size = np.zeros(capacity, np.float64)
+        self.color = np.zeros((capacity, 3), np.uint8)
+        self.gravity = np.zeros(capacity, np.float64)
+        self.drag = np.zeros(capacity, np.float64)
+
+    def __len__(self):
+        return self.count
+
+    def emit(self, x, y, vx, vy, life, size, color, gravity=430.0, drag=0.0):
+        """Append one particle, or a batch when any of the numeric arguments is an array.
+
+        Particles beyond the live limit (at most the pool capacity) are dropped.
+        """
+        sizes = [np.size(v) for v in (x, y, vx, vy, life, size, gravity, drag) if np.ndim(v)]
+        if sizes and min(sizes) == 0:
+            return 0
+        n = min(max(sizes, default=1), self.limit - self.count)
+        if n <= 0:
+            return 0
+        s = slice(self.count, self.count + n)
+        for column, value in (
+            (self.x, x),
+            (self.y, y),
+            (self.vx, vx),
+            (self.vy, vy),
+            (self.life, life),
+            (self.max_life, life),
+            (self.size, size),
+            (self.gravity, gravity),
+            (self.drag, drag),
+        ):
+            column[s] = value[:n] if np.ndim(value) else value
+        self.color[s] = color
+        self.count += n
+        return n
+
+    def update(self, dt):
+        n = self.count
+        if n == 0:
+            return
+        self.life[:n] -= dt
+        self.vx[:n] *= np.maximum(0.0, 1.0 - self.drag[:n] * dt)
+        self.x[:n] += self.vx[:n] * dt
+        self.y[:n] += self.vy[:n] * dt
+        self.vy[:n] += self.gravity[:n] * dt
+
+        dead = self.life[:n] <= 0
+        if not dead.any():
+            return
+        # Swap-remove: fill dead slots below the new count with live tail entries.
+        alive_count = n - int(np.count_nonzero(dead))
+        holes = np.flatnonzero(dead[:alive_count])
+        movers = alive_count + np.flatnonzero(~dead[alive_count:])
+        if holes.size:
+            for column in (self.x, self.y, self.vx, self.vy, self.life, self.max_life, self.size, self.color, self.gravity, self.drag):
+                column[holes] = column[movers]
+        self.count = alive_count
+
+    def render_params(self):
+        """Return (x, y, radius, alpha, color) arrays for the live particles."""
+        n = self.count
+        life_ratio = np.clip(self.life[:n] / np.maximum(0.001, self.max_life[:n]), 0.0, 1.0)
+        radius = np.clip((self.size[:n] * (0.4 + life_ratio * 1.5)).astype(np.int32), 1, 14)
+        alpha = (40 + life_ratio * 215).astype(np.int32)
+        return self.x[:n].astype(np.int32), self.y[:n].astype(np.int32), radius, alpha, self.color[:n]
+
+    def clear(self):
+        self.count = 0
+
+
+class ParticleRenderer:
+    """Draws a ParticleSystem with one Surface.blits() call from a lazily built sprite atlas."""
+
+    ALPHA_BUCKETS = 16
+
+    def __init__(self):
+        self.atlas = {}
+
+    def sprite(self, color, radius, bucket):
+        key = (color, radius, bucket)
+        sprite = self.atlas.get(key)
+        if sprite is None:
+            alpha = min(255, (bucket + 1) * 256 // self.ALPHA_BUCKETS)
+            sprite = pygame.Surface((radius * 2, radius * 2), pygame.SRCALPHA)
+            pygame.draw.circle(sprite, (*color, alpha // 2), (radius, radius), radius)
+            pygame.draw.circle(sprite, (*color, alpha), (radius, radius), max(1, radius - 1))
+            if pygame.display.get_surface() is not None:
+                sprite = sprite.convert_alpha()
+            self.atlas[key] = sprite
+        return sprite
+
+    def draw(self, surface, particles, scale=1.0):
+        if not len(particles):
+            return
+        px, py, pr, pa, pc = particles.render_params()
+        if scale != 1.0:
+            px = (px * scale).astype(np.int32)
+            py = (py * scale).astype(np.int32)
+            pr = np.maximum(1, (pr * scale).astype(np.int32))
+        buckets = (pa * self.ALPHA_BUCKETS // 256).tolist()
+        pr = pr.tolist()
+        sprite = self.sprite
+        surface.blits(
+            [
+                (sprite(color, r, b), (x - r, y - r))
+                for x, y, r, b, color in zip(px.tolist(), py.tolist(), pr, buckets, map(tuple, pc.tolist()))
+            ],
+            doreturn=False,
+        )
 
 
-def draw_wizard(surface, x, y, frame, jumping):
-    bob = math.sin(frame * 0.25) * 4 if not jumping else -4
-    px = int(x)
-    py = int(y + bob)
+def wizard_pose(frame, jumping):
+    """Return (bob, arm_offset, wand_glow) for an animation frame."""
+    bob = table_sin(frame * 0.25) * 4 if not jumping else -4
+    swing = table_sin(frame * 0.6) * 10 if not jumping else 18
+    glow = 6 + int((table_sin(frame * 0.8) + 1) * 3)
+    return bob, int(swing * 0.15), glow
 
-    # shadow
-    shadow_w = 74 if not jumping else 56
-    pygame.draw.ellipse(surface, (0, 0, 0, 100), (px - shadow_w // 2, GROUND_Y + 56, shadow_w, 18))
+
+def draw_wizard_body(surface, px, py, arm, glow, s=1):
+    """Draw the wizard (without shadow) around (px, py), with all offsets scaled by s."""
+    def r(x, y, w, h):
+        return (px + x * s, py + y * s, w * s, h * s)
+
+    def p(x, y):
+        return (px + x * s, py + y * s)
 
     # robe
-    robe = pygame.Rect(px - 35, py - 70, 70, 95)
-    pygame.draw.rect(surface, (28, 37, 88), robe, border_radius=20)
-    pygame.draw.rect(surface, (16, 22, 52), (px - 16, py - 70, 32, 88), border_radius=14)
+    pygame.draw.rect(surface, (28, 37, 88), r(-35, -70, 70, 95), border_radius=20 * s)
+    pygame.draw.rect(surface, (16, 22, 52), r(-16, -70, 32, 88), border_radius=14 * s)
 
     # scarf
-    pygame.draw.rect(surface, (158, 38, 42), (px - 22, py - 42, 44, 12), border_radius=4)
-    pygame.draw.rect(surface, (232, 198, 84), (px - 22, py - 37, 44, 4))
+    pygame.draw.rect(surface, (158, 38, 42), r(-22, -42, 44, 12), border_radius=4 * s)
+    pygame.draw.rect(surface, (232, 198, 84), r(-22, -37, 44, 4))
 
     # head + hair
-    pygame.draw.circle(surface, (248, 220, 186), (px, py - 84), 24)
-    pygame.draw.ellipse(surface, (38, 24, 18), (px - 24, py - 108, 48, 18))
-    scar = [(px - 2, py - 97), (px + 3, py - 102), (px + 1, py - 94), (px + 6, py - 99)]
-    pygame.draw.lines(surface, (214, 88, 74), False, scar, 2)
+    pygame.draw.circle(surface, (248, 220, 186), p(0, -84), 24 * s)
+    pygame.draw.ellipse(surface, (38, 24, 18), r(-24, -108, 48, 18))
+    scar = [p(-2, -97), p(3, -102), p(1, -94), p(6, -99)]
+    pygame.draw.lines(surface, (214, 88, 74), False, scar, 2 * s)
 
     # glasses
-    pygame.draw.circle(surface, (10, 10, 10), (px - 10, py - 86), 6, 2)
-    pygame.draw.circle(surface, (10, 10, 10), (px + 10, py - 86), 6, 2)
-    pygame.draw.line(surface, (10, 10, 10), (px - 4, py - 86), (px + 4, py - 86), 2)
+    pygame.draw.circle(surface, (10, 10, 10), p(-10, -86), 6 * s, 2 * s)
+    pygame.draw.circle(surface, (10, 10, 10), p(10, -86), 6 * s, 2 * s)
+    pygame.draw.line(surface, (10, 10, 10), p(-4, -86), p(4, -86), 2 * s)
 
     # hat
-    pygame.draw.rect(surface, (25, 25, 30), (px - 30, py - 120, 60, 8), border_radius=4)
-    hat_points = [(px, py - 162), (px - 20, py - 120), (px + 20, py - 120)]
-    pygame.draw.polygon(surface, (20, 20, 26), hat_points)
+    pygame.draw.rect(surface, (25, 25, 30), r(-30, -120, 60, 8), border_radius=4 * s)
+    pygame.draw.polygon(surface, (20, 20, 26), [p(0, -162), p(-20, -120), p(20, -120)])
 
     # arms
-    swing = math.sin(frame * 0.6) * 10 if not jumping else 18
-    pygame.draw.rect(surface, (28, 37, 88), (px - 48, py - 58 + int(swing * 0.15), 14, 56), border_radius=8)
-    pygame.draw.rect(surface, (28, 37, 88), (px + 34, py - 58 - int(swing * 0.15), 14, 56), border_radius=8)
+    pygame.draw.rect(surface, (28, 37, 88), r(-48, -58 + arm, 14, 56), border_radius=8 * s)
+    pygame.draw.rect(surface, (28, 37, 88), r(34, -58 - arm, 14, 56), border_radius=8 * s)
 
     # wand
-    pygame.draw.rect(surface, (96, 58, 30), (px + 40, py - 10, 5, 42), border_radius=3)
-    glow = 6 + int((math.sin(frame * 0.8) + 1) * 3)
-    pygame.draw.circle(surface, (130, 246, 255), (px + 42, py + 34), glow)
+    pygame.draw.rect(surface, (96, 58, 30), r(40, -10, 5, 42), border_radius=3 * s)
+    pygame.draw.circle(surface, (130, 246, 255), p(42, 34), glow * s)
+
+
+# Files the game reads or writes live next to this script, wherever it is launched from.
+GAME_DIR = os.path.dirname(os.path.abspath(__file__))
+ASSET_DIR = os.path.join(GAME_DIR, "assets")
+WIZARD_MESH_PATH = os.path.join(ASSET_DIR, "wizard_runner.obj")
+# One color per box of wizard_runner.obj, in file order: robe, hem, head, hat
+# brim, hat crown, arms, legs, boots, scarf, wand.
+WIZARD_MESH_COLORS = (
+    (28, 37, 88), (22, 30, 72), (248, 220, 186), (25, 25, 30), (20, 20, 26),
+    (34, 44, 102), (34, 44, 102), (16, 22, 52), (16, 22, 52), (38, 24, 18),
+    (38, 24, 18), (158, 38, 42), (96, 58, 30),
+)
+WIZARD_MESH_WAND_TIP = (0.79, 0.41, 0.12)
+WIZARD_MESH_SCALE = 50.0
+WIZARD_MESH_RUN_FRAMES = 12
+
+
+class Mesh:
+    """Triangle mesh as (N, 3) float32 vertices and (M, 3) int32 faces, rendered flat-shaded.
+
+    Faces are rewound at load so every normal points away from the center of
+    its connected part; parts are numbered in file order and pick their color
+    by that number.
+    """
+
+    MAGIC = b"WRMS"
+    LIGHT = (0.45, 0.7, 0.55)
+    loaded = {}
+
+    def __init__(self, vertices, faces):
+        self.vertices = np.array(vertices, np.float32)
+        self.faces = np.array(faces, np.int32)
+        self.parts = self.find_parts()
+        self.orient_faces()
+        self.digest = hashlib.sha1(self.vertices.tobytes() + self.faces.tobytes()).hexdigest()[:16]
+
+    @classmethod
+    def parse_obj(cls, text):
+        """Read v and f records (polygons are fanned into triangles); everything else is ignored."""
+        vertices, faces = [], []
+        for line in text.splitlines():
+            fields = line.split()
+            if not fields:
+                continue
+            if fields[0] == "v":
+                vertices.append([float(v) for v in fields[1:4]])
+            elif fields[0] == "f":
+                index = [int(f.split("/")[0]) for f in fields[1:]]
+                index = [i - 1 if i > 0 else len(vertices) + i for i in index]
+                faces.extend([index[0], index[i], index[i + 1]] for i in range(1, len(index) - 1))
+        return cls(np.array(vertices, np.float32).reshape(-1, 3), np.array(faces, np.int32).reshape(-1, 3))
+
+    def to_bytes(self):
+        header = struct.pack("<4sII", self.MAGIC, len(self.vertices), len(self.faces))
+        return header + self.vertices.astype("<f4").tobytes() + self.faces.astype("<i4").tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        magic, nv, nf = struct.unpack_from("<4sII", data)
+        if magic != cls.MAGIC:
+            raise ValueError("not a Wizard Rush mesh")
+        vertices = np.frombuffer(data, "<f4", nv * 3, 12).reshape(nv, 3)
+        faces = np.frombuffer(data, "<i4", nf * 3, 12 + nv * 12).reshape(nf, 3)
+        return cls(vertices, faces)
+
+    @classmethod
+    def load(cls, path, disk=None):
+        """Parse an OBJ file once per process, and once per content when given a DiskCache."""
+        with open(path, "rb") as f:
+            source = f.read()
+        digest = hashlib.sha1(source).hexdigest()
+        mesh = cls.loaded.get(digest)
+        if mesh is None:
+            if disk is None:
+                mesh = cls.parse_obj(source.decode())
+            else:
+                mesh = cls.from_bytes(disk.data(("mesh", digest), lambda: cls.parse_obj(source.decode()).to_bytes()))
+            cls.loaded[digest] = mesh
+        return mesh
+
+    def find_parts(self):
+        """Connected-component number of every face."""
+        parent = list(range(len(self.vertices)))
+
+        def root(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        for a, b, c in self.faces.tolist():
+            parent[root(b)] = root(a)
+            parent[root(c)] = root(a)
+        numbers = {}
+        return np.array([numbers.setdefault(root(a), len(numbers)) for a in self.faces[:, 0].tolist()], np.int32)
+
+    def orient_faces(self):
+        tri = self.vertices[self.faces]
+        centers = tri.mean(axis=1)
+        counts = np.bincount(self.parts)[:, None]
+        part_centers = np.zeros((counts.size, 3))
+        np.add.at(part_centers, self.parts, centers)
+        part_centers /= np.maximum(counts, 1)
+        normals = np.cross(tri[:, 1] - tri[:, 0], tri[:, 2] - tri[:, 0])
+        inward = np.einsum("ij,ij->i", normals, centers - part_centers[self.parts]) < 0
+        self.faces[inward] = self.faces[inward][:, ::-1]
+
+    @staticmethod
+    def transform(points, yaw, lean):
+        """Turn points by yaw around the vertical axis, then tip them forward by lean in the screen plane."""
+        cy, sy, cl, sl = math.cos(yaw), math.sin(yaw), math.cos(lean), math.sin(lean)
+        x = points[:, 0] * cy + points[:, 2] * sy
+        z = points[:, 2] * cy - points[:, 0] * sy
+        y = points[:, 1]
+        return np.stack([x * cl + y * sl, y * cl - x * sl, z], axis=1)
+
+    def rasterize(self, size, origin, scale, yaw, lean, colors):
+        """Render the mesh orthographically into a new SRCALPHA surface with a depth buffer."""
+        w, h = size
+        tri = self.transform(self.vertices, yaw, lean)[self.faces]
+        normals = np.cross(tri[:, 1] - tri[:, 0], tri[:, 2] - tri[:, 0])
+        normals /= np.maximum(np.linalg.norm(normals, axis=1, keepdims=True), 1e-9)
+        light = np.array(self.LIGHT) / np.linalg.norm(self.LIGHT)
+        shade = 0.42 + 0.58 * np.clip(normals @ light, 0.0, 1.0)
+        palette = np.array(colors, np.float64)[self.parts % len(colors)] * shade[:, None]
+        sx = origin[0] + tri[..., 0] * scale
+        sy = origin[1] - tri[..., 1] * scale
+        depth = np.full((h, w), -np.inf)
+        rgba = np.zeros((h, w, 4), np.uint8)
+
+        for i in np.flatnonzero(normals[:, 2] > 1e-6).tolist():
+            (x0, x1, x2), (y0, y1, y2), (z0, z1, z2) = sx[i], sy[i], tri[i, :, 2]
+            area = (x1 - x0) * (y2 - y0) - (x2 - x0) * (y1 - y0)
+            if abs(area) < 1e-9:
+                continue
+            left, right = max(0, int(min(x0, x1, x2))), min(w, int(max(x0, x1, x2)) + 1)
+            top, bottom = max(0, int(min(y0, y1, y2))), min(h, int(max(y0, y1, y2)) + 1)
+            if left >= right or top >= bottom:
+                continue
+            px = np.arange(left, right) + 0.5
+            py = (np.arange(top, bottom) + 0.5)[:, None]
+            # Barycentric weights from edge functions; a pixel is covered when all three agree in sign.
+            b0 = ((x1 - px) * (y2 - py) - (x2 - px) * (y1 - py)) / area
+            b1 = ((x2 - px) * (y0 - py) - (x0 - px) * (y2 - py)) / area
+            b2 = 1.0 - b0 - b1
+            z = b0 * z0 + b1 * z1 + b2 * z2
+            region = depth[top:bottom, left:right]
+            hit = (b0 >= 0) & (b1 >= 0) & (b2 >= 0) & (z > region)
+            region[hit] = z[hit]
+            rgba[top:bottom, left:right][hit] = (*palette[i].astype(np.uint8), 255)
+
+        return pygame.image.frombytes(rgba.tobytes(), size, "RGBA")
+
+
+class WizardSprites:
+    """Lazily baked wizard poses, so each frame costs a shadow blit and a body blit.
+
+    The body shape only varies with the arm offset, the wand glow radius and the
+    jumping flag, so poses are keyed on those; the sin bob becomes a blit offset.
+    On "High" effects the poses are supersampled 2x and smoothed down.
+
+    With use_mesh() the poses come from the low-poly wizard mesh instead,
+    rasterized at WIZARD_MESH_RUN_FRAMES points of the run cycle.
+
+    scaled() keeps shrunk copies of the poses for reduced render scales.
+    """
+
+    ORIGIN = (56, 164)
+    SIZE = (112, 214)
+    SUPERSAMPLE = {"Low": 1, "Medium": 1, "High": 2}
+
+    def __init__(self, fx_level="Medium"):
+        self.poses = {}
+        self.shadows = {}
+        self.supersample = self.SUPERSAMPLE[fx_level]
+        self.mesh = None
+        self.mesh_frames = {}
+        self.scaled_poses = {}
+
+    def set_fx_level(self, fx_level):
+        self.supersample = self.SUPERSAMPLE[fx_level]
+
+    def use_mesh(self, mesh):
+        self.mesh = mesh
+
+    def body(self, arm, glow, jumping):
+        key = (arm, glow, jumping, self.supersample)
+        sprite = self.poses.get(key)
+        if sprite is None:
+            sprite = self.install(key, self.render(*key))
+        return sprite
+
+    def mesh_body(self, phase, glow, jumping):
+        key = ("mesh", self.mesh.digest, phase, glow, jumping, self.supersample)
+        sprite = self.poses.get(key)
+        if sprite is None:
+            sprite = self.install(key, self.render_key(key))
+        return sprite
+
+    def render_key(self, key):
+        if key[0] == "mesh":
+            return self.render_mesh(self.mesh, *key[2:])
+        return self.render(*key)
+
+    def install(self, key, sprite):
+        if pygame.display.get_surface() is not None:
+            sprite = sprite.convert_alpha()
+        self.poses[key] = sprite
+        return sprite
+
+    def scaled(self, sprite, scale):
+        key = (sprite, scale)
+        small = self.scaled_poses.get(key)
+        if small is None:
+            w, h = sprite.get_size()
+            small = self.scaled_poses[key] = pygame.transform.smoothscale(sprite, (round(w * scale), round(h * scale)))
+        return small
+
+    @classmethod
+    def render(cls, arm, glow, jumping, s):
+        sprite = pygame.Surface((cls.SIZE[0] * s, cls.SIZE[1] * s), pygame.SRCALPHA)
+        draw_wizard_body(sprite, cls.ORIGIN[0] * s, cls.ORIGIN[1] * s, arm, glow, s)
+        if s > 1:
+            sprite = pygame.transform.smoothscale(sprite, cls.SIZE)
+        return sprite
+
+    def render_mesh(self, mesh, phase, glow, jumping, s):
+        frame_key = (mesh.digest, phase, jumping, s)
+        frame = self.mesh_frames.get(frame_key)
+        if frame is None:
+            frame = self.mesh_frames[frame_key] = self.rasterize_mesh(mesh, phase, jumping, s)
+        sprite, tip = frame[0].copy(), frame[1]
+        pygame.draw.circle(sprite, (130, 246, 255), tip, glow * s)
+        if s > 1:
+            sprite = pygame.transform.smoothscale(sprite, self.SIZE)
+        return sprite
+
+    @classmethod
+    def rasterize_mesh(cls, mesh, phase, jumping, s):
+        """Rasterize one point of the run cycle; returns the sprite and the wand tip position."""
+        if jumping:
+            yaw, lean = math.radians(42), math.radians(-6)
+        else:
+            t = phase * math.tau / WIZARD_MESH_RUN_FRAMES
+            yaw, lean = math.radians(38 + 7 * math.sin(t)), math.radians(6 + 2 * math.sin(2 * t))
+        # Model y=0 sits 10px above the pose origin, which puts the boot soles at the hitbox bottom.
+        origin = (cls.ORIGIN[0] * s, (cls.ORIGIN[1] - 10) * s)
+        scale = WIZARD_MESH_SCALE * s
+        sprite = mesh.rasterize((cls.SIZE[0] * s, cls.SIZE[1] * s), origin, scale, yaw, lean, WIZARD_MESH_COLORS)
+        tip = mesh.transform(np.array([WIZARD_MESH_WAND_TIP]), yaw, lean)[0]
+        return sprite, (origin[0] + tip[0] * scale, origin[1] - tip[1] * scale)
+
+    def shadow(self, width, height=18):
+        sprite = self.shadows.get((width, height))
+        if sprite is None:
+            sprite = pygame.Surface((width, height), pygame.SRCALPHA)
+            pygame.draw.ellipse(sprite, (0, 0, 0), (0, 0, width, height))
+            self.shadows[width, height] = sprite
+        return sprite
+
+    def pose_keys(self):
+        """Keys of every running and jumping pose at the current quality."""
+        if self.mesh is not None:
+            for jumping, phases in ((False, range(WIZARD_MESH_RUN_FRAMES)), (True, (0,))):
+                for phase in phases:
+                    for glow in range(6, 13):
+                        yield ("mesh", self.mesh.digest, phase, glow, jumping, self.supersample)
+            return
+        for jumping, arms in ((False, (-1, 0, 1)), (True, (2,))):
+            for arm in arms:
+                for glow in range(6, 13):
+                    yield (arm, glow, jumping, self.supersample)
+
+    def bake(self):
+        for key in self.pose_keys():
+            if key not in self.poses:
+                self.install(key, self.render_key(key))
+
+
+WIZARD_SPRITES = WizardSprites()
+
+
+def draw_wizard(surface, x, y, frame, jumping, scale=1.0):
+    bob, arm, glow = wizard_pose(frame, jumping)
+    px = int(x)
+    py = int(y + bob)
+
+    shadow_w = 74 if not jumping else 56
+    ox, oy = WizardSprites.ORIGIN
+    if WIZARD_SPRITES.mesh is not None:
+        phase = int(frame * 0.25 / math.tau * WIZARD_MESH_RUN_FRAMES) % WIZARD_MESH_RUN_FRAMES
+        body = WIZARD_SPRITES.mesh_body(0 if jumping else phase, glow, jumping)
+    else:
+        body = WIZARD_SPRITES.body(arm, glow, jumping)
+    if scale == 1.0:
+        surface.blit(WIZARD_SPRITES.shadow(shadow_w), (px - shadow_w // 2, GROUND_Y + 56))
+        surface.blit(body, (px - ox, py - oy))
+    else:
+        shadow = scale_rect(px - shadow_w // 2, GROUND_Y + 56, shadow_w, 18, scale)
+        surface.blit(WIZARD_SPRITES.shadow(shadow.w, shadow.h), shadow)
+        surface.blit(WIZARD_SPRITES.scaled(body, scale), (round((px - ox) * scale), round((py - oy) * scale)))
 
     # collision rect
     return pygame.Rect(px - 28, py - 106, 56, 132)
 
 
-def main():
+SPEED_PROFILE = {
+    "Easy": (360, 1.25),
+    "Normal": (470, 1.0),
+    "Hard": (580, 0.82),
+}
+
+
+class Effects:
+    """Particle emitters and screen-effect timers driven by gameplay events."""
+
+    def __init__(self, fx_level="High", particles=None):
+        self.level = fx_level
+        self.post_fx = True
+        self.particles = particles if particles is not None else ParticleSystem()
+        self.shake_time = 0.0
+        self.shake_power = 0.0
+        self.chroma_time = 0.0
+        self.flash_time = 0.0
+
+    def jump_dust_count(self):
+        return 4 if self.level == "Low" else 7 if self.level == "Medium" else 10
+
+    def emit_dust(self, x, y, count, tint=(180, 205, 230)):
+        rng = self.particles.rng
+        self.particles.emit(
+            x + rng.uniform(-16, 16, count),
+            y + rng.uniform(-4, 3, count),
+            rng.uniform(-120, 95, count),
+            rng.uniform(-140, -40, count),
+            rng.uniform(0.2, 0.38, count),
+            rng.integers(2, 6, count),
+            tint,
+            gravity=340,
+            drag=1.6,
+        )
+
+    def emit_sparks(self, x, y, count, tint=(130, 245, 255)):
+        rng = self.particles.rng
+        self.particles.emit(
+            x + rng.uniform(-10, 10, count),
+            y + rng.uniform(-10, 10, count),
+            rng.uniform(-170, 170, count),
+            rng.uniform(-240, -50, count),
+            rng.uniform(0.22, 0.5, count),
+            rng.integers(2, 7, count),
+            tint,
+            gravity=420,
+            drag=0.45,
+        )
+
+    def emit_hit_burst(self, x, y, count, tint):
+        rng = self.particles.rng
+        self.particles.emit(
+            x,
+            y,
+            rng.uniform(-260, 260, count),
+            rng.uniform(-320, 110, count),
+            rng.uniform(0.3, 0.7, count),
+            rng.integers(3, 9, count),
+            tint,
+            gravity=520,
+            drag=0.25,
+        )
+
+    def emit_spell_trail(self, start, end, tint):
+        rng = self.particles.rng
+        t = np.linspace(0.0, 1.0, 10)
+        self.emit_sparks(
+            start[0] + (end[0] - start[0]) * t + rng.uniform(-3, 3, 10),
+            start[1] + (end[1] - start[1]) * t + rng.uniform(-3, 3, 10),
+            10,
+            tint,
+        )
+
+    def trigger_impact_vfx(self, x, y, tint=(255, 140, 140), power=1.0):
+        self.shake_time = max(self.shake_time, 0.22 * power)
+        self.shake_power = max(self.shake_power, 11.0 * power)
+        if self.post_fx:
+            self.chroma_time = max(self.chroma_time, 0.16 * power)
+            self.flash_time = max(self.flash_time, 0.1 * power)
+        self.emit_hit_burst(x, y, int(16 * power), tint)
+
+    def ambient(self, player_y, grounded, dt):
+        """Trail sparks from the wand and dust under the feet, scaled to the step length."""
+        rng = self.particles.rng
+        steps = dt * FPS
+        if self.level != "Low" and rng.random() < (0.11 if self.level == "Medium" else 0.19) * steps:
+            self.emit_sparks(PLAYER_X + 42, int(player_y) - 26, 1, (130, 245, 255))
+        if grounded and rng.random() < (0.08 if self.level == "Low" else 0.14) * steps:
+            self.emit_dust(PLAYER_X - 8, GROUND_Y + 64, 1, (164, 184, 206))
+
+    def update_timers(self, dt):
+        if self.shake_time > 0.0:
+            self.shake_time = max(0.0, self.shake_time - dt)
+        if self.chroma_time > 0.0:
+            self.chroma_time = max(0.0, self.chroma_time - dt)
+        if self.flash_time > 0.0:
+            self.flash_time = max(0.0, self.flash_time - dt)
+
+    def clear(self):
+        self.shake_time = 0.0
+        self.shake_power = 0.0
+        self.chroma_time = 0.0
+        self.flash_time = 0.0
+        self.particles.clear()
+
+
+class Obstacle:
+    __slots__ = ("rect", "kind", "phase", "x", "prev_x")
+
+    def __init__(self, rect, kind, phase):
+        self.rect = rect
+        self.kind = kind
+        self.phase = phase
+        self.x = float(rect.x)
+        self.prev_x = self.x
+
+
+class ObstacleLane:
+    """Obstacles in a growable ring buffer, ordered left to right.
+
+    Everything scrolls at the same speed and spawns at the right edge, so
+    append order is x order: expiry pops from the left in O(1) and lookups
+    around the player are binary searches instead of full scans.
+    """
+
+    def __init__(self, capacity=16):
+        self.items = [None] * capacity
+        self.head = 0
+        self.size = 0
+        self.max_width = 0
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, i):
+        if not 0 <= i < self.size:
+            raise IndexError(i)
+        return self.items[(self.head + i) % len(self.items)]
+
+    def __iter__(self):
+        return iter(self.slice(0, self.size))
+
+    def slice(self, start, stop):
+        """Obstacles start..stop-1 as a list, without walking the whole ring."""
+        cap = len(self.items)
+        start, stop = self.head + start, self.head + stop
+        if stop <= cap:
+            return self.items[start:stop]
+        if start >= cap:
+            return self.items[start - cap:stop - cap]
+        return self.items[start:] + self.items[:stop - cap]
+
+    def append(self, o):
+        cap = len(self.items)
+        if self.size == cap:
+            self.items = list(self) + [None] * cap
+            self.head = 0
+            cap *= 2
+        self.items[(self.head + self.size) % cap] = o
+        self.size += 1
+        self.max_width = max(self.max_width, o.rect.width)
+
+    def popleft(self):
+        o = self.items[self.head]
+        self.items[self.head] = None
+        self.head = (self.head + 1) % len(self.items)
+        self.size -= 1
+        return o
+
+    def remove_at(self, i):
+        """Remove the i-th obstacle, shifting whichever side of the ring is shorter."""
+        items, cap = self.items, len(self.items)
+        o = self[i]
+        if i < self.size // 2:
+            for j in range(i, 0, -1):
+                items[(self.head + j) % cap] = items[(self.head + j - 1) % cap]
+            items[self.head] = None
+            self.head = (self.head + 1) % cap
+        else:
+            for j in range(i, self.size - 1):
+                items[(self.head + j) % cap] = items[(self.head + j + 1) % cap]
+            items[(self.head + self.size - 1) % cap] = None
+        self.size -= 1
+        return o
+
+    def index_after(self, x):
+        """Index of the first obstacle whose left edge is greater than x."""
+        items, cap, head = self.items, len(self.items), self.head
+        lo, hi = 0, self.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if items[(head + mid) % cap].rect.x > x:
+                hi = mid
+            else:
+                lo = mid + 1
+        return lo
+
+    def first_right_of(self, x):
+        """Index of the first obstacle whose center is past x, or -1."""
+        start = self.index_after(x - self.max_width // 2 - 1)
+        for i, o in enumerate(self.slice(start, self.size), start):
+            if o.rect.centerx > x:
+                return i
+        return -1
+
+    def expire(self, left):
+        while self.size and self.items[self.head].rect.right < left:
+            self.popleft()
+
+    def clear(self):
+        self.items = [None] * len(self.items)
+        self.head = 0
+        self.size = 0
+        self.max_width = 0
+
+
+class World:
+    """Gameplay simulation for one run, advanced in fixed steps by step().
+
+    Gameplay randomness comes from the world's own seeded RNG, and the
+    double-tap window is measured on the simulation clock, so a run only
+    depends on its seed, its tuning and the step at which inputs arrive.
+    Visual effects go through the optional Effects object and never touch the
+    gameplay RNG.
+    """
+
+    def __init__(
+        self,
+        difficulty="Normal",
+        seed=None,
+        fx=None,
+        speed=None,
+        spawn_interval=None,
+        gravity=1500.0,
+        jump_force=690.0,
+        long_jump_window=0.28,
+        wall_chance=0.28,
+    ):
+        self.rng = random.Random(seed)
+        self.fx = fx
+        self.speed, self.spawn_interval = SPEED_PROFILE[difficulty]
+        if speed is not None:
+            self.speed = speed
+        if spawn_interval is not None:
+            self.spawn_interval = spawn_interval
+        self.gravity = gravity
+        self.jump_force = jump_force
+        self.long_jump_window = long_jump_window
+        self.wall_chance = wall_chance
+        self.distance = 0.0
+        self.prev_distance = 0.0
+        self.obstacles = ObstacleLane()
+        self.reset()
+
+    def reset(self, seed=None):
+        if seed is not None:
+            self.rng.seed(seed)
+        self.time = 0.0
+        self.steps = 0
+        self.player_y = GROUND_Y
+        self.prev_player_y = GROUND_Y
+        self.player_vel_y = 0.0
+        self.long_jump_active = 0.0
+        self.last_jump_time = -10.0
+        self.score = 0.0
+        self.spawn_timer = 0.0
+        self.alive = True
+        self.hit = None
+        self.spells_cast = 0
+        self.obstacles.clear()
+        self.prev_distance = self.distance
+
+    def set_difficulty(self, difficulty):
+        self.speed, self.spawn_interval = SPEED_PROFILE[difficulty]
+
+    @property
+    def grounded(self):
+        return self.player_y >= GROUND_Y - 0.1
+
+    def player_hitbox(self):
+        return pygame.Rect(PLAYER_X - 28, int(self.player_y) - 106, 56, 132)
+
+    def jump(self):
+        is_double_tap = (self.time - self.last_jump_time) <= self.long_jump_window
+        fx = self.fx
+
+        if self.grounded:
+            if is_double_tap:
+                self.player_vel_y = -(self.jump_force * 1.2)
+                self.long_jump_active = 0.24
+            else:
+                self.player_vel_y = -self.jump_force
+                self.long_jump_active = 0.0
+
+            if fx is not None:
+                tint = (215, 232, 255) if not is_double_tap else (250, 214, 120)
+                fx.emit_dust(PLAYER_X, GROUND_Y + 64, fx.jump_dust_count(), tint)
+                if is_double_tap:
+                    fx.trigger_impact_vfx(PLAYER_X, GROUND_Y + 52, (250, 214, 120), 0.55)
+        elif is_double_tap and self.long_jump_active <= 0.0:
+            self.player_vel_y = min(self.player_vel_y, -(self.jump_force * 0.55))
+            self.long_jump_active = 0.2
+            if fx is not None:
+                fx.emit_sparks(PLAYER_X + 24, self.player_y + 14, 10, (246, 225, 128))
+
+        self.last_jump_time = self.time
+
+    def spawn_obstacle(self):
+        rng = self.rng
+        kind = "wall" if rng.random() < self.wall_chance else "hurdle"
+        if kind == "wall":
+            h = rng.randint(230, 300)
+            w = rng.randint(74, 96)
+        else:
+            h = rng.randint(70, 165)
+            w = rng.randint(45, 75)
+        y = GROUND_Y + 60 - h
+
+        rect = pygame.Rect(WIDTH + 30, y, w, h)
+        self.obstacles.append(Obstacle(rect, kind, rng.uniform(0, 6.28)))
+
+    def cast_spell(self):
+        index = self.obstacles.first_right_of(PLAYER_X)
+        if index < 0:
+            return None
+        target = self.obstacles.remove_at(index)
+        self.spells_cast += 1
+        if self.fx is not None:
+            hurdle = target.kind == "hurdle"
+            tx, ty = target.rect.center
+            self.fx.emit_spell_trail((PLAYER_X + 42, int(self.player_y) - 18), (tx, ty), (138, 246, 255) if hurdle else (192, 152, 255))
+            self.fx.emit_hit_burst(tx, ty, 12, (130, 245, 255) if hurdle else (198, 160, 255))
+            if not hurdle:
+                self.fx.trigger_impact_vfx(tx, ty, (205, 170, 255), 0.8)
+        return target
+
+    def step(self, dt):
+        """Advance the run by one fixed simulation step."""
+        self.prev_player_y = self.player_y
+        self.prev_distance = self.distance
+        self.time += dt
+        self.steps += 1
+
+        effective_gravity = self.gravity * (0.58 if self.long_jump_active > 0.0 else 1.0)
+        if self.long_jump_active > 0.0:
+            self.long_jump_active = max(0.0, self.long_jump_active - dt)
+        self.player_vel_y += effective_gravity * dt
+        self.player_y += self.player_vel_y * dt
+        if self.player_y > GROUND_Y:
+            self.player_y = GROUND_Y
+            self.player_vel_y = 0.0
+
+        self.score += dt * (11 + self.speed * 0.035)
+        self.spawn_timer += dt
+        if self.spawn_timer >= self.spawn_interval:
+            self.spawn_timer -= self.spawn_interval
+            self.spawn_obstacle()
+
+        self.distance += self.speed * dt
+
+        shift = self.speed * dt
+        for o in self.obstacles:
+            o.prev_x = o.x
+            o.x -= shift
+            o.rect.x = math.floor(o.x)
+            o.phase += dt * 3.2
+        self.obstacles.expire(-40)
+
+        player_hitbox = self.player_hitbox()
+        obstacles = self.obstacles
+        start = obstacles.index_after(player_hitbox.left - obstacles.max_width - 1)
+        for o in obstacles.slice(start, len(obstacles)):
+            if o.rect.x >= player_hitbox.right:
+                break
+            if player_hitbox.colliderect(o.rect):
+                self.alive = False
+                self.hit = o
+                if self.fx is not None:
+                    tint = (255, 130, 130) if o.kind == "hurdle" else (196, 138, 255)
+                    self.fx.trigger_impact_vfx(player_hitbox.centerx, player_hitbox.centery, tint, 1.3)
+                break
+
+        if self.fx is not None:
+            self.fx.ambient(self.player_y, self.grounded, dt)
+
+    def render_player_y(self, alpha):
+        return self.prev_player_y + (self.player_y - self.prev_player_y) * alpha
+
+    def render_distance(self, alpha):
+        return self.prev_distance + (self.distance - self.prev_distance) * alpha
+
+    def render_obstacle_rect(self, o, alpha):
+        rect = o.rect.copy()
+        rect.x = math.floor(o.prev_x + (o.x - o.prev_x) * alpha)
+        return rect
+
+
+INPUT_JUMP = "jump"
+INPUT_CAST = "cast"
+
+
+def apply_input(world, action):
+    if action == INPUT_JUMP:
+        world.jump()
+    elif action == INPUT_CAST:
+        world.cast_spell()
+    elif action in SPEED_PROFILE:
+        world.set_difficulty(action)
+
+
+def autopilot(world):
+    """Simple bot policy: break walls with a spell and jump hurdles just in time."""
+    for o in world.obstacles:
+        rect = o.rect
+        if rect.right < PLAYER_X - 28:
+            continue
+        gap = rect.left - (PLAYER_X + 28)
+        if o.kind == "wall":
+            return (INPUT_CAST,) if gap < 320 else ()
+        tall = rect.height > 110
+        if world.grounded and gap < world.speed * (0.24 if tall else 0.2):
+            return (INPUT_JUMP,)
+        if tall and not world.grounded and world.long_jump_active <= 0.0 and world.time - world.last_jump_time < 0.05:
+            return (INPUT_JUMP,)
+        return ()
+    return ()
+
+
+def play_headless(world, inputs=(), policy=None, max_time=300.0, dt=SIM_DT):
+    """Advance world with no window or drawing until it crashes or max_time elapses.
+
+    inputs is an iterable of (step, action) pairs sorted by step; policy, if
+    given, is called before every step and returns the actions to apply.
+    """
+    pending = iter(inputs)
+    next_input = next(pending, None)
+    max_steps = int(round(max_time / dt))
+    step = 0
+    while world.alive and step < max_steps:
+        while next_input is not None and next_input[0] <= step:
+            apply_input(world, next_input[1])
+            next_input = next(pending, None)
+        if policy is not None:
+            for action in policy(world):
+                apply_input(world, action)
+        world.step(dt)
+        step += 1
+    return world
+
+
+def simulate(seed, inputs=(), difficulty="Normal", policy=None, max_time=300.0, **tuning):
+    """Run one headless game and return its final score.
+
+    tuning is forwarded to World (speed, spawn_interval, gravity, jump_force,
+    long_jump_window, wall_chance).
+    """
+    world = World(difficulty, seed=seed, **tuning)
+    return int(play_headless(world, inputs, policy, max_time).score)
+
+
+class BatchWorld:
+    """K independent headless runs advanced in lockstep with NumPy.
+
+    Player state lives in (K,) arrays and obstacles in (K, M) slot arrays. All
+    runs share a spawn interval, so every run spawns on the same step and the
+    slots form one ring buffer indexed by spawn count. Runs follow World's
+    rules but draw from a NumPy generator, so they match World statistically
+    rather than seed-for-seed. Tuning values may be scalars or (K,) arrays,
+    except spawn_interval which is shared.
+    """
+
+    def __init__(
+        self,
+        k,
+        difficulty="Normal",
+        seed=None,
+        speed=None,
+        spawn_interval=None,
+        gravity=1500.0,
+        jump_force=690.0,
+        long_jump_window=0.28,
+        wall_chance=0.28,
+    ):
+        self.k = k
+        self.rng = np.random.default_rng(seed)
+        base_speed, base_interval = SPEED_PROFILE[difficulty]
+        self.speed = np.broadcast_to(np.asarray(base_speed if speed is None else speed, np.float64), (k,))
+        self.spawn_interval = float(base_interval if spawn_interval is None else spawn_interval)
+        self.gravity = np.broadcast_to(np.asarray(gravity, np.float64), (k,))
+        self.jump_force = np.broadcast_to(np.asarray(jump_force, np.float64), (k,))
+        self.long_jump_window = np.broadcast_to(np.asarray(long_jump_window, np.float64), (k,))
+        self.wall_chance = np.broadcast_to(np.asarray(wall_chance, np.float64), (k,))
+
+        lifetime = (WIDTH + 30 + 96 + 40) / max(1.0, float(self.speed.min()))
+        m = int(math.ceil(lifetime / self.spawn_interval)) + 2
+        self.time = 0.0
+        self.spawn_timer = 0.0
+        self.spawned = 0
+        self.player_y = np.full(k, float(GROUND_Y))
+        self.player_vel_y = np.zeros(k)
+        self.long_jump_active = np.zeros(k)
+        self.last_jump_time = np.full(k, -10.0)
+        self.score = np.zeros(k)
+        self.alive = np.ones(k, bool)
+        self.death_time = np.full(k, np.nan)
+        self.hit_wall = np.zeros(k, bool)
+        self.spells_cast = np.zeros(k, np.int64)
+        self.seq = np.full(m, -1, np.int64)
+        self.ob_active = np.zeros((k, m), bool)
+        self.ob_x = np.zeros((k, m))
+        self.ob_rx = np.zeros((k, m), np.int64)
+        self.ob_y = np.zeros((k, m), np.int64)
+        self.ob_w = np.zeros((k, m), np.int64)
+        self.ob_h = np.zeros((k, m), np.int64)
+        self.ob_wall = np.zeros((k, m), bool)
+
+    @property
+    def grounded(self):
+        return self.player_y >= GROUND_Y - 0.1
+
+    def first_obstacle(self, mask):
+        """Index of the oldest obstacle per run among mask, and whether one exists."""
+        order = np.where(mask, self.seq[None, :], np.iinfo(np.int64).max)
+        index = order.argmin(axis=1)
+        return index, mask.any(axis=1)
+
+    def jump(self, mask):
+        mask = mask & self.alive
+        is_double_tap = (self.time - self.last_jump_time) <= self.long_jump_window
+        grounded = self.grounded
+        long_jump = mask & grounded & is_double_tap
+        short_jump = mask & grounded & ~is_double_tap
+        boost = mask & ~grounded & is_double_tap & (self.long_jump_active <= 0.0)
+
+        self.player_vel_y = np.where(long_jump, -(self.jump_force * 1.2), self.player_vel_y)
+        self.player_vel_y = np.where(short_jump, -self.jump_force, self.player_vel_y)
+        self.player_vel_y = np.where(boost, np.minimum(self.player_vel_y, -(self.jump_force * 0.55)), self.player_vel_y)
+        self.long_jump_active = np.select([long_jump, short_jump, boost], [0.24, 0.0, 0.2], self.long_jump_active)
+        self.last_jump_time = np.where(mask, self.time, self.last_jump_time)
+
+    def cast(self, mask):
+        ahead = self.ob_active & (self.ob_rx + self.ob_w // 2 > PLAYER_X)
+        index, found = self.first_obstacle(ahead)
+        rows = np.flatnonzero(mask & self.alive & found)
+        self.ob_active[rows, index[rows]] = False
+        self.spells_cast[rows] += 1
+
+    def spawn(self):
+        k = self.k
+        rng = self.rng
+        slot = self.spawned % self.seq.size
+        wall = rng.random(k) < self.wall_chance
+        h = np.where(wall, rng.integers(230, 301, k), rng.integers(70, 166, k))
+        w = np.where(wall, rng.integers(74, 97, k), rng.integers(45, 76, k))
+        self.seq[slot] = self.spawned
+        self.ob_active[:, slot] = True
+        self.ob_x[:, slot] = WIDTH + 30
+        self.ob_rx[:, slot] = WIDTH + 30
+        self.ob_y[:, slot] = GROUND_Y + 60 - h
+        self.ob_w[:, slot] = w
+        self.ob_h[:, slot] = h
+        self.ob_wall[:, slot] = wall
+        self.spawned += 1
+
+    def step(self, dt):
+        self.time += dt
+        alive = self.alive
+
+        lja = self.long_jump_active
+        effective_gravity = self.gravity * np.where(lja > 0.0, 0.58, 1.0)
+        self.long_jump_active = np.maximum(0.0, lja - dt)
+        self.player_vel_y = self.player_vel_y + effective_gravity * dt
+        self.player_y = self.player_y + self.player_vel_y * dt
+        landed = self.player_y > GROUND_Y
+        self.player_y[landed] = GROUND_Y
+        self.player_vel_y[landed] = 0.0
+
+        self.score += np.where(alive, dt * (11 + self.speed * 0.035), 0.0)
+        self.spawn_timer += dt
+        if self.spawn_timer >= self.spawn_interval:
+            self.spawn_timer -= self.spawn_interval
+            self.spawn()
+
+        self.ob_x -= self.speed[:, None] * dt
+        self.ob_rx = np.floor(self.ob_x).astype(np.int64)
+        self.ob_active &= self.ob_rx + self.ob_w >= -40
+
+        top = np.floor(self.player_y).astype(np.int64)[:, None] - 106
+        overlap = (
+            self.ob_active
+            & (PLAYER_X - 28 < self.ob_rx + self.ob_w)
+            & (self.ob_rx < PLAYER_X + 28)
+            & (top < self.ob_y + self.ob_h)
+            & (self.ob_y < top + 132)
+        )
+        index, crashed = self.first_obstacle(overlap)
+        crashed &= alive
+        if crashed.any():
+            rows = np.flatnonzero(crashed)
+            self.alive[rows] = False
+            self.death_time[rows] = self.time
+            self.hit_wall[rows] = self.ob_wall[rows, index[rows]]
+
+
+def batch_autopilot(batch):
+    """Vectorized autopilot(): returns (jump_mask, cast_mask) for every run."""
+    ahead = batch.ob_active & (batch.ob_rx + batch.ob_w >= PLAYER_X - 28)
+    index, found = batch.first_obstacle(ahead)
+    rows = np.arange(batch.k)
+    gap = batch.ob_rx[rows, index] - (PLAYER_X + 28)
+    wall = found & batch.ob_wall[rows, index]
+    hurdle = found & ~wall
+    tall = batch.ob_h[rows, index] > 110
+    grounded = batch.grounded
+
+    cast = wall & (gap < 320)
+    jump = hurdle & grounded & (gap < batch.speed * np.where(tall, 0.24, 0.2))
+    jump |= (
+        hurdle
+        & tall
+        & ~grounded
+        & (batch.long_jump_active <= 0.0)
+        & (batch.time - batch.last_jump_time < 0.05)
+    )
+    return jump, cast
+
+
+def run_batch(k, seed=None, difficulty="Normal", policy=batch_autopilot, max_time=300.0, dt=SIM_DT, **tuning):
+    """Run k headless games in lockstep until all crash or max_time elapses."""
+    batch = BatchWorld(k, difficulty, seed=seed, **tuning)
+    max_steps = int(round(max_time / dt))
+    for _ in range(max_steps):
+        if not batch.alive.any():
+            break
+        if policy is not None:
+            jump, cast = policy(batch)
+            if jump.any():
+                batch.jump(jump)
+            if cast.any():
+                batch.cast(cast)
+        batch.step(dt)
+    return batch
+
+
+REPLAY_MAGIC = b"WRPL"
+REPLAY_VERSION = 1
+REPLAY_DIR = os.path.join(GAME_DIR, "replays")
+REPLAY_JUMP = 0
+REPLAY_CAST = 1
+REPLAY_PAUSE = 2
+REPLAY_RESUME = 3
+REPLAY_DIFFICULTY = 4
+REPLAY_END = 7
+DIFFICULTIES = ("Easy", "Normal", "Hard")
+
+
+def write_varint(buf, value):
+    while value >= 0x80:
+        buf.append((value & 0x7F) | 0x80)
+        value >>= 7
+    buf.append(value)
+
+
+def read_varint(data, pos):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+class Replay:
+    """Seed plus per-step input events for one run, stored as delta-encoded varints.
+
+    Each event is one varint holding (steps since previous event << 3 | code),
+    followed by a second varint for difficulty changes. A REPLAY_END event
+    closes the stream, followed by the recorded final score as a double so
+    playback can be checked bit for bit.
+    """
+
+    def __init__(self, seed, difficulty="Normal"):
+        self.seed = seed
+        self.difficulty = difficulty
+        self.events = []
+        self.end_step = None
+        self.score = None
+
+    def record(self, step, code, arg=0):
+        self.events.append((step, code, arg))
+
+    def finish(self, world):
+        self.end_step = world.steps
+        self.score = world.score
+
+    def inputs(self):
+        """The recorded events as play_headless() inputs."""
+        for step, code, arg in self.events:
+            if code == REPLAY_JUMP:
+                yield step, INPUT_JUMP
+            elif code == REPLAY_CAST:
+                yield step, INPUT_CAST
+            elif code == REPLAY_DIFFICULTY:
+                yield step, DIFFICULTIES[arg]
+
+    def to_bytes(self):
+        buf = bytearray(REPLAY_MAGIC)
+        buf.append(REPLAY_VERSION)
+        write_varint(buf, self.seed)
+        buf.append(DIFFICULTIES.index(self.difficulty))
+        last = 0
+        for step, code, arg in self.events:
+            write_varint(buf, (step - last) << 3 | code)
+            if code == REPLAY_DIFFICULTY:
+                write_varint(buf, arg)
+            last = step
+        write_varint(buf, (self.end_step - last) << 3 | REPLAY_END)
+        buf += struct.pack("<d", self.score)
+        return bytes(buf)
+
+    @classmethod
+    def from_bytes(cls, data):
+        if data[:4] != REPLAY_MAGIC or data[4:5] != bytes([REPLAY_VERSION]):
+            raise ValueError("not a Wizard Rush replay")
+        try:
+            return cls.decode(data)
+        except (IndexError, struct.error):
+            raise ValueError("truncated Wizard Rush replay") from None
+
+    @classmethod
+    def decode(cls, data):
+        seed, pos = read_varint(data, 5)
+        replay = cls(seed, DIFFICULTIES[data[pos]])
+        pos += 1
+        step = 0
+        while True:
+            value, pos = read_varint(data, pos)
+            step += value >> 3
+            code = value & 7
+            if code == REPLAY_END:
+                break
+            arg = 0
+            if code == REPLAY_DIFFICULTY:
+                arg, pos = read_varint(data, pos)
+            replay.record(step, code, arg)
+        replay.end_step = step
+        (replay.score,) = struct.unpack_from("<d", data, pos)
+        return replay
+
+    def save(self, path, data=None):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(self.to_bytes() if data is None else data)
+
+    def save_in_background(self, path):
+        """Encode now and write from a one-shot thread, so game over never waits on the disk.
+
+        The thread is not a daemon, so quitting still finishes the write.
+        """
+        data = self.to_bytes()
+
+        def write():
+            try:
+                self.save(path, data)
+            except OSError as exc:
+                print(f"replay: could not write {path}: {exc}", file=sys.stderr)
+
+        thread = threading.Thread(target=write, name="replay-writer")
+        thread.start()
+        return thread
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read())
+
+
+def play_replay(replay):
+    """Fast-forward a replay headless and return the finished World."""
+    world = World(replay.difficulty, seed=replay.seed)
+    return play_headless(world, replay.inputs(), max_time=replay.end_step * SIM_DT)
+
+
+STATS_PATH = os.path.join(GAME_DIR, "wizard_rush_stats.db")
+
+
+class RunStats:
+    """Finished runs logged to SQLite in WAL mode by a background writer thread.
+
+    record() only queues a row and updates the in-memory best scores, so game
+    over never waits on the disk. The writer collects whatever arrives within
+    BATCH_DELAY and inserts it in one transaction. load() reads the best score
+    per difficulty once at startup through the (difficulty, score) index.
+    """
+
+    BATCH_DELAY = 1.0
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS runs (
+            id INTEGER PRIMARY KEY,
+            ended_at REAL NOT NULL,
+            seed INTEGER NOT NULL,
+            difficulty TEXT NOT NULL,
+            score INTEGER NOT NULL,
+            survived REAL NOT NULL,
+            steps INTEGER NOT NULL,
+            cause TEXT,
+            spells_cast INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS runs_by_score ON runs (difficulty, score);
+        CREATE VIEW IF NOT EXISTS difficulty_summary AS
+            SELECT difficulty,
+                   COUNT(*) AS runs,
+                   MAX(score) AS best,
+                   AVG(score) AS mean_score,
+                   AVG(survived) AS mean_survived,
+                   SUM(cause = 'hurdle') AS hurdle_deaths,
+                   SUM(cause = 'wall') AS wall_deaths,
+                   SUM(spells_cast) AS spells_cast
+            FROM runs GROUP BY difficulty;
+    """
+    INSERT = (
+        "INSERT INTO runs (ended_at, seed, difficulty, score, survived, steps, cause, spells_cast)"
+        " VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+    )
+
+    def __init__(self, path=STATS_PATH):
+        self.path = path
+        self.enabled = True
+        self.best = {difficulty: 0 for difficulty in DIFFICULTIES}
+        self.rows = queue.Queue()
+        self.thread = None
+
+    def connect(self):
+        db = sqlite3.connect(self.path)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.executescript(self.SCHEMA)
+        return db
+
+    def load(self):
+        try:
+            with contextlib.closing(self.connect()) as db:
+                for difficulty in DIFFICULTIES:
+                    (score,) = db.execute("SELECT MAX(score) FROM runs WHERE difficulty = ?", (difficulty,)).fetchone()
+                    self.best[difficulty] = score or 0
+        except sqlite3.Error as exc:
+            print(f"run stats: {self.path} unavailable, runs will not be saved: {exc}", file=sys.stderr)
+            self.enabled = False
+        return self
+
+    def start(self):
+        if self.enabled:
+            self.thread = threading.Thread(target=self.run, name="stats-writer", daemon=True)
+            self.thread.start()
+
+    def run(self):
+        db = self.connect()
+        done = False
+        while not done:
+            batch = [self.rows.get()]
+            deadline = time.monotonic() + self.BATCH_DELAY
+            while batch[-1] is not None:
+                try:
+                    batch.append(self.rows.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            if batch[-1] is None:
+                done = True
+                batch.pop()
+            try:
+                with db:
+                    db.executemany(self.INSERT, batch)
+            except sqlite3.Error as exc:
+                print(f"run stats: dropped {len(batch)} runs: {exc}", file=sys.stderr)
+        db.close()
+
+    def record(self, world, difficulty, seed):
+        """Queue a finished run; returns the best score for its difficulty."""
+        score = int(world.score)
+        self.best[difficulty] = max(self.best[difficulty], score)
+        if self.enabled:
+            cause = world.hit.kind if world.hit is not None else None
+            self.rows.put((time.time(), seed, difficulty, score, round(world.time, 4), world.steps, cause, world.spells_cast))
+        return self.best[difficulty]
+
+    def close(self):
+        """Write out everything queued and stop the writer."""
+        if self.thread is not None:
+            self.rows.put(None)
+            self.thread.join()
+            self.thread = None
+
+    def summary(self):
+        """Rows of the difficulty_summary view, as dicts."""
+        with contextlib.closing(self.connect()) as db:
+            db.row_factory = sqlite3.Row
+            return [dict(row) for row in db.execute("SELECT * FROM difficulty_summary ORDER BY best DESC")]
+
+
+def draw_cloud(surface, c, x, y):
+    pygame.draw.ellipse(surface, (120, 132, 178), (x, y + c["y"], c["w"], 42))
+    pygame.draw.ellipse(surface, (106, 120, 164), (x + 38, y + c["y"] - 18, c["w"] - 52, 40))
+
+
+def draw_hill_back(surface, h, x, y):
+    pygame.draw.rect(surface, (44, 52, 90), (x, y + HEIGHT - 270 - h["h"], 220, h["h"]), border_radius=24)
+
+
+def draw_hill_mid(surface, h, x, y):
+    pygame.draw.rect(surface, (62, 66, 102), (x, y + HEIGHT - 235 - h["h"], 220, h["h"]), border_radius=22)
+
+
+def draw_spire(surface, s, x, y):
+    spire_body = pygame.Rect(x, y + HEIGHT - 238 - s["h"], s["w"], s["h"])
+    pygame.draw.rect(surface, (48, 44, 70), spire_body, border_radius=6)
+    roof = [(x + s["w"] // 2, spire_body.y - 28), (x - 8, spire_body.y + 4), (x + s["w"] + 8, spire_body.y + 4)]
+    pygame.draw.polygon(surface, (34, 30, 52), roof)
+    window_y = spire_body.y + 28
+    while window_y < spire_body.bottom - 18:
+        pygame.draw.rect(surface, (232, 194, 122), (x + s["w"] // 2 - 3, window_y, 6, 10), border_radius=2)
+        window_y += 26
+
+
+def draw_fog(surface, f, x, y):
+    pygame.draw.ellipse(surface, (98, 128, 170), (x, y + f["y"], f["w"], 80))
+
+
+def draw_lane_mark(surface, _, x, y):
+    pygame.draw.rect(surface, (190, 220, 255), (x, y + GROUND_Y + 88, 54, 8), border_radius=4)
+
+
+def draw_rune(surface, _, x, y):
+    y += GROUND_Y
+    pygame.draw.polygon(surface, (120, 220, 255), [(x, y + 56), (x + 10, y + 46), (x + 20, y + 56), (x + 10, y + 66)])
+
+
+class ParallaxLayer:
+    """One scrolling layer baked into a seamlessly wrapping colorkeyed strip.
+
+    Items wrap with a fixed period and never change, so the strip is baked
+    once and each frame blits it at the layer's scroll offset. Reduced render
+    scales use a nearest-neighbour copy, which keeps the colorkey exact.
+    """
+
+    COLORKEY = (255, 0, 255)
+
+    def __init__(self, name, factor, low, period, top, bottom, items, draw_item):
+        self.name = name
+        self.factor = factor
+        self.low = low
+        self.period = period
+        self.top = top
+        self.bottom = bottom
+        self.items = items
+        self.draw_item = draw_item
+        self.strip = None
+        self.scaled = {}
+
+    def item_x(self, item):
+        return item["x"] if isinstance(item, dict) else item
+
+    def render(self):
+        strip = pygame.Surface((self.period, self.bottom - self.top))
+        strip.fill(self.COLORKEY)
+        for item in self.items:
+            u = (self.item_x(item) - self.low) % self.period
+            for x in (u - self.period, u, u + self.period):
+                self.draw_item(strip, item, x, -self.top)
+        return strip
+
+    def install(self, strip):
+        strip.set_colorkey(self.COLORKEY, pygame.RLEACCEL)
+        if pygame.display.get_surface() is not None:
+            strip = strip.convert()
+        self.strip = strip
+        self.scaled = {}
+        return strip
+
+    def bake(self):
+        return self.install(self.render())
+
+    def scaled_strip(self, scale):
+        strip = self.scaled.get(scale)
+        if strip is None:
+            full = self.strip or self.bake()
+            strip = pygame.transform.scale(full, (round(full.get_width() * scale), round(full.get_height() * scale)))
+            strip.set_colorkey(self.COLORKEY, pygame.RLEACCEL)
+            self.scaled[scale] = strip
+        return strip
+
+    def draw(self, surface, distance, scale=1.0):
+        if scale == 1.0:
+            strip, period, top = self.strip or self.bake(), self.period, self.top
+            x = self.low - int((distance * self.factor) % period)
+        else:
+            strip, top = self.scaled_strip(scale), round(self.top * scale)
+            period = strip.get_width()
+            x = round(self.low * scale) - int((distance * self.factor * scale) % period)
+        width = surface.get_width()
+        while x < width:
+            surface.blit(strip, (x, top))
+            x += period
+
+
+# Renderer builds its backdrop from this seed, so the baked parallax strips and
+# their disk-cache keys are the same on every launch.
+SCENERY_SEED = 20240611
+
+
+class Scenery:
+    """Procedural backdrop whose parallax layers are positioned from the world scroll distance."""
+
+    # Back layers dropped first when set_detail() asks for fewer.
+    DROP_ORDER = ("fog_bands", "clouds_far", "castle_spires", "hills_mid")
+    TWINKLE_LEVELS = 16
+
+    def __init__(self, rng=random):
+        self.stars = [(rng.randint(0, WIDTH), rng.randint(20, 360), rng.randint(1, 3)) for _ in range(80)]
+        self.star_phase = np.array([sx for sx, _, _ in self.stars], np.float64)
+        self.star_sprites = {}
+        self.scaled_stars = {1.0: self.stars}
+        self.hills_back = [{"x": i * 180, "h": rng.randint(120, 220)} for i in range(10)]
+        self.hills_mid = [{"x": i * 170, "h": rng.randint(170, 280)} for i in range(10)]
+        self.castle_spires = [{"x": i * 240 + 100, "w": rng.randint(36, 66), "h": rng.randint(170, 310)} for i in range(7)]
+        self.clouds_far = [{"x": i * 260, "y": rng.randint(85, 200), "w": rng.randint(150, 260)} for i in range(8)]
+        self.fog_bands = [{"x": i * 300, "y": rng.randint(400, 560), "w": rng.randint(220, 340)} for i in range(7)]
+        self.lane_marks = [i * 90 for i in range(20)]
+        self.runes = [i * 150 for i in range(14)]
+
+        clouds, fog = self.clouds_far, self.fog_bands
+        self.back_layers = [
+            ParallaxLayer("clouds_far", 0.09, -300, 260 * len(clouds), min(c["y"] for c in clouds) - 18, max(c["y"] for c in clouds) + 42, clouds, draw_cloud),
+            ParallaxLayer("hills_back", 0.18, -220, 180 * len(self.hills_back), HEIGHT - 270 - max(h["h"] for h in self.hills_back), HEIGHT - 270, self.hills_back, draw_hill_back),
+            ParallaxLayer("hills_mid", 0.34, -220, 170 * len(self.hills_mid), HEIGHT - 235 - max(h["h"] for h in self.hills_mid), HEIGHT - 235, self.hills_mid, draw_hill_mid),
+            ParallaxLayer("castle_spires", 0.28, -140, 240 * len(self.castle_spires), HEIGHT - 266 - max(s["h"] for s in self.castle_spires), HEIGHT - 238, self.castle_spires, draw_spire),
+            ParallaxLayer("fog_bands", 0.24, -360, 300 * len(fog), min(f["y"] for f in fog), max(f["y"] for f in fog) + 80, fog, draw_fog),
+        ]
+        self.ground_layers = [
+            ParallaxLayer("lane_marks", 0.95, -120, 1800, GROUND_Y + 88, GROUND_Y + 96, self.lane_marks, draw_lane_mark),
+            ParallaxLayer("runes", 0.72, -170, 2200, GROUND_Y + 46, GROUND_Y + 67, self.runes, draw_rune),
+        ]
+        self.visible_layers = self.back_layers
+
+    @property
+    def layers(self):
+        return self.back_layers + self.ground_layers
+
+    def bake(self):
+        for layer in self.layers:
+            layer.bake()
+
+    def set_detail(self, count):
+        """Draw only count back layers, dropping them in DROP_ORDER."""
+        dropped = self.DROP_ORDER[:max(0, len(self.back_layers) - count)]
+        self.visible_layers = [layer for layer in self.back_layers if layer.name not in dropped]
+
+    def star_sprite(self, radius, level):
+        key = (radius, level)
+        sprite = self.star_sprites.get(key)
+        if sprite is None:
+            alpha = 120 + level * 120 // (self.TWINKLE_LEVELS - 1)
+            sprite = pygame.Surface((radius * 2 + 1, radius * 2 + 1), pygame.SRCALPHA)
+            pygame.draw.circle(sprite, (220, 235, 255, alpha), (radius, radius), radius)
+            if pygame.display.get_surface() is not None:
+                sprite = sprite.convert_alpha()
+            self.star_sprites[key] = sprite
+        return sprite
+
+    def draw_stars(self, surface, frame, scale=1.0):
+        """Twinkle every star from one vectorized sine, drawn with a single blits() call."""
+        wave = np.sin((frame + self.star_phase) * 0.02)
+        levels = ((wave + 1.0) * ((self.TWINKLE_LEVELS - 1) / 2) + 0.5).astype(np.int32).tolist()
+        stars = self.scaled_stars.get(scale)
+        if stars is None:
+            stars = self.scaled_stars[scale] = [
+                (round(sx * scale), round(sy * scale), max(1, round(sr * scale))) for sx, sy, sr in self.stars
+            ]
+        sprite = self.star_sprite
+        surface.blits(
+            [(sprite(sr, level), (sx - sr, sy - sr)) for (sx, sy, sr), level in zip(stars, levels)],
+            doreturn=False,
+        )
+
+    def draw(self, surface, distance, scale=1.0):
+        for layer in self.visible_layers:
+            layer.draw(surface, distance, scale)
+
+        pygame.draw.rect(surface, (34, 36, 56), scale_rect(0, GROUND_Y + 52, WIDTH, 180, scale))
+        pygame.draw.rect(surface, (82, 174, 235), scale_rect(0, GROUND_Y + 48, WIDTH, 6, scale))
+        pygame.draw.rect(surface, (44, 54, 78), scale_rect(0, GROUND_Y + 124, WIDTH, 98, scale))
+        for layer in self.ground_layers:
+            layer.draw(surface, distance, scale)
+
+
+FONT_SPECS = (
+    # (Renderer attribute, system font name, size, bold)
+    ("title_font", "georgia", 72, True),
+    ("h1_font", "georgia", 42, True),
+    ("body_font", "segoeui", 28, False),
+    ("small_font", "segoeui", 22, False),
+)
+
+
+def load_font(path, size, fake_bold):
+    """Open a font the way SysFont would; path None is pygame's builtin font."""
+    font = pygame.font.Font(path, size)
+    font.set_bold(fake_bold)
+    return font
+
+
+class Renderer:
+    """Draws one frame of the game in named stages.
+
+    render_frame() runs the stages in order; when given a timings dict it
+    appends each stage's duration in seconds under the stage name. Stages draw
+    onto self.canvas, which is the screen itself unless screen shake or
+    chromatic aberration is active; then it is a persistent offscreen target
+    that post_fx() presents at the shake offset.
+
+    World stages draw onto self.view. Below a render_scale of 1.0 that is a
+    smaller surface, drawn with coordinates multiplied by the scale, and the
+    upscale stage stretches it onto the canvas once before the HUD is drawn
+    at full resolution.
+    """
+
+    STAGES = ("background", "parallax", "obstacles", "wizard", "particles", "upscale", "hud", "post_fx")
+    SKY = ((11, 16, 44), (42, 28, 66))
+
+    def __init__(self, screen, scenery=None, render_scale=1.0):
+        self.screen = screen
+        self.canvas = screen
+        self.render_scale = render_scale
+        self.view = screen
+        self.view_scale = 1.0
+        self.low = None
+        self.target = None
+        self.red_pass = None
+        self.cyan_pass = None
+        self.vignette = None
+        self.flash = None
+        self.ui_base = None
+        self.ui_key = None
+        self.ui_buttons = ()
+        self.ui_particles = None
+        self.sky_cache = SkyLayerCache()
+        self.scenery = scenery if scenery is not None else Scenery(random.Random(SCENERY_SEED))
+        self.particle_renderer = ParticleRenderer()
+        self.set_fonts({attr: load_font(None, size, bold) for attr, _, size, bold in FONT_SPECS})
+
+    def set_fonts(self, fonts):
+        """Swap in resolved fonts; starts with pygame's builtin font until the loader has them."""
+        for attr, font in fonts.items():
+            setattr(self, attr, font)
+        self.score_digits = DigitAtlas(self.body_font, (210, 240, 255))
+        self.invalidate()
+
+    def set_render_scale(self, scale):
+        self.render_scale = scale
+        self.invalidate()
+
+    def view_size(self):
+        w, h = self.screen.get_size()
+        return round(w * self.render_scale), round(h * self.render_scale)
+
+    def draw_background(self, frame):
+        self.view.blit(self.sky_cache.get(self.view.get_size(), *self.SKY), (0, 0))
+        self.scenery.draw_stars(self.view, frame, self.view_scale)
+
+    def draw_parallax(self, distance):
+        self.scenery.draw(self.view, distance, self.view_scale)
+
+    def draw_obstacles(self, world, alpha):
+        screen = self.view
+        s = self.view_scale
+        for o in world.obstacles:
+            rect = world.render_obstacle_rect(o, alpha)
+            if s != 1.0:
+                rect = scale_rect(*rect, s)
+            if o.kind == "wall":
+                aura = (148, 110, 246)
+                body = (76, 46, 122)
+                trim = (198, 164, 255)
+                symbol = (238, 220, 255)
+            else:
+                aura = (220, 80, 120)
+                body = (118, 42, 62)
+                trim = (190, 80, 110)
+                symbol = (245, 120, 150)
+
+            if s == 1.0:
+                draw_soft_glow(screen, rect.center, max(rect.width, rect.height), aura, 30, quantize=16)
+                pygame.draw.rect(screen, body, rect, border_radius=8)
+                pygame.draw.rect(screen, tuple(min(255, c + 30) for c in body), (rect.x + 6, rect.y + 8, max(4, rect.w - 12), max(4, rect.h - 12)), border_radius=6)
+                pygame.draw.rect(screen, trim, rect, 2, border_radius=8)
+                pulse_r = max(5, rect.w // 8) + int((table_sin(o.phase) + 1.0) * 2)
+            else:
+                draw_soft_glow(screen, rect.center, max(rect.width, rect.height), aura, 30, quantize=max(1, round(16 * s)))
+                pygame.draw.rect(screen, body, rect, border_radius=round(8 * s))
+                inner = (rect.x + round(6 * s), rect.y + round(8 * s), max(4, rect.w - round(12 * s)), max(4, rect.h - round(12 * s)))
+                pygame.draw.rect(screen, tuple(min(255, c + 30) for c in body), inner, border_radius=round(6 * s))
+                pygame.draw.rect(screen, trim, rect, max(1, round(2 * s)), border_radius=round(8 * s))
+                pulse_r = max(round(5 * s), rect.w // 8) + int((table_sin(o.phase) + 1.0) * 2 * s)
+            pygame.draw.circle(screen, symbol, rect.center, pulse_r, 1)
+
+    def draw_player(self, player_y, frame):
+        draw_wizard(self.view, PLAYER_X, player_y, frame, player_y < GROUND_Y - 0.1, self.view_scale)
+
+    def draw_particles(self, fx):
+        self.particle_renderer.draw(self.view, fx.particles, self.view_scale)
+
+    def upscale(self, dest=None):
+        """Stretch a reduced view onto dest (the canvas by default)."""
+        dest = self.canvas if dest is None else dest
+        if self.view is dest:
+            return
+        # Whole-number factors repeat every pixel equally often; only other factors need filtering.
+        stretch = pygame.transform.scale if (1.0 / self.view_scale).is_integer() else pygame.transform.smoothscale
+        stretch(self.view, dest.get_size(), dest)
+
+    def draw_hud(self, score, best):
+        screen = self.canvas
+        draw_soft_glow(screen, (160, 74), 180, (95, 170, 255), 35)
+        pygame.draw.rect(screen, (10, 14, 36), (24, 20, 270, 110), border_radius=16)
+        pygame.draw.rect(screen, (128, 170, 255), (24, 20, 270, 110), 2, border_radius=16)
+        label = TEXT_CACHE.render(self.body_font, "SCORE  ", (210, 240, 255))
+        screen.blit(label, (42, 38))
+        self.score_digits.draw(screen, score, (42 + label.get_width(), 38))
+        screen.blit(TEXT_CACHE.render(self.small_font, f"BEST   {best}", (190, 206, 238)), (42, 75))
+        screen.blit(TEXT_CACHE.render(self.small_font, "SPACE x2 long jump  E breaks cursed walls  ESC pause", (140, 220, 255)), (36, HEIGHT - 42))
+
+    def draw_center_panel(self, title, subtitle):
+        screen = self.canvas
+        h1_font = self.h1_font
+        small_font = self.small_font
+        panel = pygame.Rect(WIDTH // 2 - 300, 170, 600, 390)
+        draw_soft_glow(screen, panel.center, 360, (84, 132, 255), 26)
+        pygame.draw.rect(screen, (8, 12, 28), panel, border_radius=22)
+        pygame.draw.rect(screen, (145, 180, 255), panel, 2, border_radius=22)
+        pygame.draw.rect(screen, (176, 208, 255), (panel.x + 12, panel.y + 14, panel.w - 24, 6), border_radius=3)
+        text = TEXT_CACHE.render(h1_font, title, (210, 226, 255))
+        screen.blit(text, (panel.centerx - text.get_width() // 2, panel.y + 30))
+        if subtitle:
+            text = TEXT_CACHE.render(small_font, subtitle, (165, 195, 235))
+            screen.blit(text, (panel.centerx - text.get_width() // 2, panel.y + 90))
+
+    def draw_buttons(self, buttons, mouse_pos):
+        for b in buttons:
+            b.draw(self.canvas, self.body_font, mouse_pos)
+
+    def ensure_buffers(self):
+        """(Re)create the offscreen targets and post-FX buffers when the screen size or render scale changes."""
+        if self.render_scale != 1.0 and (self.low is None or self.low.get_size() != self.view_size()):
+            self.low = pygame.Surface(self.view_size(), 0, self.screen)
+        size = self.screen.get_size()
+        if self.target is not None and self.target.get_size() == size:
+            return
+        self.target = self.screen.copy()
+        self.red_pass = self.screen.copy()
+        self.cyan_pass = self.screen.copy()
+        self.flash = self.screen.copy()
+        self.flash.fill((240, 245, 255))
+        self.vignette = pygame.Surface(size, pygame.SRCALPHA)
+        pygame.draw.rect(self.vignette, (0, 0, 0, 58), (0, 0, *size), width=110, border_radius=10)
+        if pygame.display.get_surface() is not None:
+            self.vignette = self.vignette.convert_alpha()
+
+    def begin_frame(self, fx, scaled=True):
+        self.ensure_buffers()
+        self.canvas = self.target if fx.shake_time > 0.0 or fx.chroma_time > 0.0 else self.screen
+        if scaled and self.render_scale != 1.0:
+            self.view, self.view_scale = self.low, self.render_scale
+        else:
+            self.view, self.view_scale = self.canvas, 1.0
+
+    def post_fx(self, fx):
+        screen = self.screen
+        self.canvas.blit(self.vignette, (0, 0))
+
+        if self.canvas is not screen:
+            frame_img = self.canvas
+            shake_x = 0
+            shake_y = 0
+            if fx.shake_time > 0.0:
+                decay = fx.shake_time / 0.22
+                amount = fx.shake_power * clamp(decay, 0.0, 1.0)
+                shake_x = int(random.uniform(-amount, amount))
+                shake_y = int(random.uniform(-amount * 0.7, amount * 0.7))
+                fx.shake_power = max(0.0, fx.shake_power * 0.92)
+
+            if shake_x or shake_y:
+                screen.fill((0, 0, 0))
+            screen.blit(frame_img, (shake_x, shake_y))
+
+            if fx.chroma_time > 0.0:
+                strength = clamp(fx.chroma_time / 0.16, 0.0, 1.0)
+                offset = int(2 + strength * 4)
+                for buffer, tint, dx in ((self.red_pass, (255, 90, 90), offset), (self.cyan_pass, (110, 235, 255), -offset)):
+                    buffer.blit(frame_img, (0, 0))
+                    buffer.fill(tint, special_flags=pygame.BLEND_RGB_MULT)
+                    buffer.set_alpha(int(65 * strength))
+                    screen.blit(buffer, (shake_x + dx, shake_y))
+
+        if fx.flash_time > 0.0:
+            self.flash.set_alpha(int(130 * clamp(fx.flash_time / 0.1, 0.0, 1.0)))
+            screen.blit(self.flash, (0, 0))
+
+    def render_frame(self, world, fx, alpha, frame, draw_ui, timings=None, snapshot=None, between_stages=None):
+        """Draw the world at interpolation factor alpha, then draw_ui(), then post-FX.
+
+        If snapshot is given, the world layers (everything before particles)
+        are copied into it. between_stages, if given, is called after every
+        stage; main() polls input there.
+        """
+        self.ui_key = None
+        self.begin_frame(fx)
+        player_y = world.render_player_y(alpha)
+        stages = (
+            ("background", self.draw_background, (frame,)),
+            ("parallax", self.draw_parallax, (world.render_distance(alpha),)),
+            ("obstacles", self.draw_obstacles, (world, alpha)),
+            ("wizard", self.draw_player, (player_y, frame)),
+            ("particles", self.draw_particles, (fx,)),
+            ("upscale", self.upscale, ()),
+            ("hud", draw_ui, ()),
+            ("post_fx", self.post_fx, (fx,)),
+        )
+        for name, stage, args in stages:
+            started = time.perf_counter() if timings is not None else 0.0
+            stage(*args)
+            if name == "wizard" and snapshot is not None:
+                if self.view is self.canvas:
+                    snapshot.blit(self.canvas, (0, 0))
+                else:
+                    self.upscale(snapshot)
+            if timings is not None:
+                timings.setdefault(name, []).append(time.perf_counter() - started)
+            if between_stages is not None:
+                between_stages()
+
+    def invalidate(self):
+        """Force the next render_ui() call to redraw and present the whole frame."""
+        self.ui_key = None
+
+    def particle_bounds(self, fx):
+        if not len(fx.particles):
+            return None
+        px, py, pr, _, _ = fx.particles.render_params()
+        left, top = int((px - pr).min()), int((py - pr).min())
+        return pygame.Rect(left, top, int((px + pr).max()) - left + 1, int((py + pr).max()) - top + 1)
+
+    def render_ui(self, world, fx, alpha, frame, title, subtitle, buttons, mouse_pos, timings=None):
+        """Draw a menu-style frame over the frozen world, redrawing only what changed.
+
+        The first frame of a panel is drawn in full and the world layers are
+        snapshotted. After that only regions whose button hover or label
+        changed, or that hold live particles, are recomposed under a clip.
+        Below full render scale, frames with live particles are drawn in full.
+        Returns None when the whole screen must be flipped, otherwise the list
+        of dirty rects for pygame.display.update().
+        """
+        screen = self.screen
+        key = (title, subtitle, id(buttons), fx.level, screen.get_size(), self.render_scale)
+        button_state = [(b.rect, b.label, b.rect.collidepoint(mouse_pos)) for b in buttons]
+
+        def draw_ui():
+            self.draw_center_panel(title, subtitle)
+            self.draw_buttons(buttons, mouse_pos)
+
+        shaking = fx.shake_time > 0.0 and fx.shake_power * clamp(fx.shake_time / 0.22, 0.0, 1.0) >= 1.0
+        particles = self.particle_bounds(fx)
+        # Below full scale particles belong in the reduced view, which the
+        # retained path does not keep, so frames with live ones are redrawn.
+        if key != self.ui_key or shaking or (particles is not None and self.render_scale != 1.0):
+            if self.ui_base is None or self.ui_base.get_size() != screen.get_size():
+                self.ui_base = screen.copy()
+            self.render_frame(world, fx, alpha, frame, draw_ui, timings, snapshot=self.ui_base)
+            self.ui_key = key
+            self.ui_buttons = button_state
+            self.ui_particles = particles
+            return None
+
+        started = time.perf_counter()
+        dirty = [state[0].inflate(4, 16) for state, old in zip(button_state, self.ui_buttons) if state != old]
+        for bounds in (self.ui_particles, particles):
+            if bounds is not None:
+                dirty.append(bounds)
+        self.ui_buttons = button_state
+        self.ui_particles = particles
+
+        screen_rect = screen.get_rect()
+        dirty = [r.inflate(16, 16).clip(screen_rect) for r in dirty]
+        dirty = [r for r in dirty if r.w and r.h]
+        if dirty:
+            self.begin_frame(fx, scaled=False)
+            surfaces = {screen, self.canvas, self.red_pass, self.cyan_pass}
+            for rect in dirty:
+                for surface in surfaces:
+                    surface.set_clip(rect)
+                self.canvas.blit(self.ui_base, (0, 0))
+                self.draw_particles(fx)
+                draw_ui()
+                self.post_fx(fx)
+            for surface in surfaces:
+                surface.set_clip(None)
+        if timings is not None:
+            timings.setdefault("retained", []).append(time.perf_counter() - started)
+        return dirty
+
+
+ASSET_CACHE_DIR = os.path.join(GAME_DIR, "cache")
+
+
+class DiskCache:
+    """Baked assets on disk, keyed by a hash of their inputs, this source file and pygame's version.
+
+    Any edit to the drawing code changes the hash, so stale files are never
+    read; they are just left behind. Failures to read or write fall back to
+    baking, so the cache can never break startup.
+    """
+
+    SURFACE_MAGIC = b"WRSF"
+
+    def __init__(self, directory=ASSET_CACHE_DIR):
+        self.directory = directory
+        self.digest = None
+
+    def path(self, parts, ext):
+        if self.digest is None:
+            with open(os.path.abspath(__file__), "rb") as f:
+                self.digest = hashlib.sha1(f.read() + pygame.version.ver.encode()).hexdigest()
+        key = hashlib.sha1((self.digest + repr(parts)).encode()).hexdigest()
+        return os.path.join(self.directory, key[:24] + ext)
+
+    def write(self, path, data):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError:
+            pass
+
+    def data(self, parts, build):
+        """Return the cached bytes for parts, building and storing them on a miss."""
+        path = self.path(parts, ".bin")
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except OSError:
+            pass
+        data = build()
+        self.write(path, data)
+        return data
+
+    def surface(self, parts, bake):
+        """Return the cached surface for parts, baking and storing it on a miss."""
+        path = self.path(parts, ".srf")
+        try:
+            with open(path, "rb") as f:
+                magic, w, h, alpha = struct.unpack("<4sHHB", f.read(9))
+                if magic == self.SURFACE_MAGIC:
+                    return pygame.image.frombytes(zlib.decompress(f.read()), (w, h), "RGBA" if alpha else "RGB")
+        except (OSError, struct.error, zlib.error, ValueError):
+            pass
+        surface = bake()
+        alpha = bool(surface.get_flags() & pygame.SRCALPHA)
+        header = struct.pack("<4sHHB", self.SURFACE_MAGIC, *surface.get_size(), alpha)
+        self.write(path, header + zlib.compress(pygame.image.tobytes(surface, "RGBA" if alpha else "RGB"), 1))
+        return surface
+
+    def json(self, parts, build, valid=lambda value: True):
+        path = self.path(parts, ".json")
+        try:
+            with open(path) as f:
+                value = json.load(f)
+            if valid(value):
+                return value
+        except (OSError, ValueError):
+            pass
+        value = build()
+        self.write(path, json.dumps(value).encode())
+        return value
+
+
+def resolve_fonts(disk=None):
+    """Map each FONT_SPECS attribute to load_font() arguments.
+
+    Finding system fonts scans the font directories, which can take seconds
+    on some Linux boxes, so the resolved paths are cached on disk.
+    """
+
+    def scan():
+        faces = {}
+        for _, name, _, bold in FONT_SPECS:
+            path = pygame.font.match_font(name, bold=bold)
+            faces[f"{name}:{int(bold)}"] = [path, bold and (path is None or path == pygame.font.match_font(name))]
+        return faces
+
+    def still_installed(faces):
+        return all(path is None or os.path.exists(path) for path, _ in faces.values())
+
+    faces = disk.json(("fonts", FONT_SPECS), scan, still_installed) if disk else scan()
+    return {attr: (faces[f"{name}:{int(bold)}"][0], size, faces[f"{name}:{int(bold)}"][1]) for attr, name, size, bold in FONT_SPECS}
+
+
+class AssetLoader:
+    """Resolves fonts and bakes render caches on a worker thread while the menu is up.
+
+    The first frames use pygame's builtin font and bake sprites lazily. The
+    worker only builds plain surfaces, reading them from the DiskCache when it
+    can; poll() runs on the main thread and swaps each result in, converting
+    it to the display format there.
+    """
+
+    def __init__(self, renderer, disk=None):
+        self.renderer = renderer
+        self.disk = disk
+        self.ready = queue.Queue()
+        self.thread = None
+
+    def cached(self, parts, bake):
+        return self.disk.surface(parts, bake) if self.disk else bake()
+
+    def jobs(self):
+        """Yield (name, bake, install) triples; bake runs on any thread, install on the main one."""
+        renderer = self.renderer
+        yield "fonts", lambda: resolve_fonts(self.disk), lambda specs: renderer.set_fonts(
+            {attr: load_font(*spec) for attr, spec in specs.items()}
+        )
+
+        sky = SkyLayerCache.key(renderer.view_size(), *Renderer.SKY)
+        yield "sky", lambda: self.cached(("sky",) + sky, lambda: SkyLayerCache.render(*sky)), lambda layer: renderer.sky_cache.install(sky, layer)
+
+        for layer in renderer.scenery.layers:
+            parts = ("parallax", layer.name, layer.low, layer.period, layer.top, layer.bottom, repr(layer.items))
+            yield layer.name, lambda parts=parts, layer=layer: self.cached(parts, layer.render), layer.install
+
+        for key in WIZARD_SPRITES.pose_keys():
+            yield (
+                f"wizard{key}",
+                lambda key=key: self.cached(("wizard",) + key, lambda: WIZARD_SPRITES.render_key(key)),
+                lambda sprite, key=key: WIZARD_SPRITES.install(key, sprite),
+            )
+
+        # The HUD and panel glows plus every quantized obstacle aura draw_obstacles() can ask for.
+        glows = [(180, (95, 170, 255), 35), (360, (84, 132, 255), 26)]
+        glows += [(r, (220, 80, 120), 30) for r in range(80, 177, 16)]
+        glows += [(r, (148, 110, 246), 30) for r in range(240, 305, 16)]
+        for radius, color, alpha in glows:
+            yield "glow", lambda g=(radius, color, alpha): GlowCache.render(*g), lambda sprite, key=(radius, color, alpha): GLOW_CACHE.put(key, sprite)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="asset-loader", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        for name, bake, install in self.jobs():
+            try:
+                self.ready.put((install, bake()))
+            except Exception as exc:
+                print(f"asset loader: {name} failed, baking lazily instead: {exc}", file=sys.stderr)
+
+    def poll(self):
+        """Install every finished result; call once per frame from the main thread."""
+        while True:
+            try:
+                install, result = self.ready.get_nowait()
+            except queue.Empty:
+                return
+            install(result)
+
+    def load(self):
+        """Bake and install everything synchronously, for tools that need a warm renderer."""
+        for _, bake, install in self.jobs():
+            install(bake())
+
+
+PROFILE_TRACE_PATH = os.path.join(GAME_DIR, "wizard_rush_trace.json")
+NULL_SECTION = contextlib.nullcontext()
+
+
+class ProfileSection:
+    __slots__ = ("profiler", "name", "started")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.name, self.started, time.perf_counter())
+
+
+class Profiler:
+    """Per-frame section timings, counters and a Chrome trace buffer behind the F3 overlay.
+
+    section() returns a shared no-op context manager while disabled, so the
+    timers can stay around the main loop's sections for free. Renderer stage
+    timings arrive through the timings dict, which is None while disabled;
+    stages run back to back inside the "draw" section, so they are laid out
+    in the trace from its start. Input latency is measured from an input's
+    FramePacer stamp to the end of the present that first shows its step.
+    """
+
+    HISTORY = 240
+    TRACE_EVENTS = 60000
+    GRAPH_MS = 33.4
+
+    def __init__(self):
+        self.enabled = False
+        self.origin = time.perf_counter()
+        self.frame_times = deque(maxlen=self.HISTORY)
+        self.latencies = deque(maxlen=self.HISTORY)
+        self.sections = {}
+        self.current = {}
+        self.starts = {}
+        self.timings = None
+        self.trace = deque(maxlen=self.TRACE_EVENTS)
+        self.frame_started = None
+        self.counts = {}
+        self.surfaces_seen = None
+        self.frames = 0
+        self.panel = None
+        self.font = None
+        self.message = ""
+
+    def toggle(self):
+        self.enabled = not self.enabled
+        self.timings = {} if self.enabled else None
+        self.current.clear()
+        self.starts.clear()
+        self.frame_started = None
+        self.surfaces_seen = None
+
+    def section(self, name):
+        return ProfileSection(self, name) if self.enabled else NULL_SECTION
+
+    def record(self, name, started, ended):
+        self.current[name] = self.current.get(name, 0.0) + (ended - started) * 1000.0
+        self.starts.setdefault(name, started)
+        self.trace.append(("X", name, started, ended - started))
+
+    def record_latency(self, stamps, presented):
+        if not self.enabled:
+            return
+        for stamp in stamps:
+            ms = (presented - stamp) * 1000.0
+            self.latencies.append(ms)
+            self.trace.append(("C", "input latency", presented, {"ms": round(ms, 2)}))
+
+    @staticmethod
+    def baked_surfaces(renderer):
+        """Surfaces created so far by every cache the frame loop can allocate through."""
+        return (
+            GLOW_CACHE.misses
+            + TEXT_CACHE.misses
+            + len(WIZARD_SPRITES.poses)
+            + len(WIZARD_SPRITES.shadows)
+            + len(WIZARD_SPRITES.scaled_poses)
+            + sum(len(layer.scaled) for layer in renderer.scenery.layers)
+            + len(renderer.particle_renderer.atlas)
+            + len(renderer.scenery.star_sprites)
+            + len(renderer.sky_cache.layers)
+        )
+
+    def next_frame(self, world, fx, renderer):
+        """Close the previous frame's record; call once at the top of every loop iteration."""
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        if self.frame_started is not None:
+            at = self.starts.get("draw", now)
+            for name, values in self.timings.items():
+                for seconds in values:
+                    self.trace.append(("X", name, at, seconds))
+                    at += seconds
+                self.current[name] = sum(values) * 1000.0
+                values.clear()
+            self.frame_times.append((now - self.frame_started) * 1000.0)
+            for name in self.sections.keys() | self.current.keys():
+                self.sections.setdefault(name, deque(maxlen=self.HISTORY)).append(self.current.get(name, 0.0))
+        surfaces = self.baked_surfaces(renderer)
+        self.counts = {
+            "particles": len(fx.particles),
+            "obstacles": len(world.obstacles),
+            "new surfaces": max(0, surfaces - self.surfaces_seen) if self.surfaces_seen is not None else 0,
+        }
+        self.surfaces_seen = surfaces
+        self.trace.append(("C", "counts", now, dict(self.counts)))
+        self.current = {}
+        self.starts = {}
+        self.frame_started = now
+        self.frames += 1
+
+    def export(self, path=PROFILE_TRACE_PATH):
+        """Write the trace buffer as Chrome trace-event JSON (chrome://tracing, Perfetto)."""
+        events = []
+        for kind, name, at, value in self.trace:
+            event = {"name": name, "ph": kind, "ts": round((at - self.origin) * 1e6, 1), "pid": 1, "tid": 1}
+            if kind == "X":
+                event["dur"] = round(value * 1e6, 1)
+            else:
+                event["args"] = value
+            events.append(event)
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        self.message = f"saved {len(events)} events to {path}"
+        return path
+
+    def stats(self, name):
+        values = self.sections.get(name)
+        if not values:
+            return 0.0, 0.0
+        return sum(values) / len(values), max(values)
+
+    def build_panel(self):
+        if self.font is None:
+            self.font = pygame.font.Font(None, 20)
+        lines = ["PROFILER  F3 hide  F4 save trace"]
+        if self.frame_times:
+            times = self.frame_times
+            lines.append(f"frame      {sum(times) / len(times):6.2f} avg {max(times):6.2f} max ms")
+        order = ["wait", "events", "update", "draw"] + list(Renderer.STAGES) + ["retained", "overlay", "present"]
+        for name in order + sorted(self.sections.keys() - set(order)):
+            if name in self.sections:
+                avg, peak = self.stats(name)
+                indent = "  " if name in Renderer.STAGES or name == "retained" else ""
+                lines.append(f"{indent}{name:<{11 - len(indent)}}{avg:6.2f} avg {peak:6.2f} max ms")
+        if self.latencies:
+            latencies = self.latencies
+            lines.append(f"input lag  {sum(latencies) / len(latencies):6.2f} avg {max(latencies):6.2f} max ms")
+        lines.append("  ".join(f"{name} {value}" for name, value in self.counts.items()))
+        for label, cache in (("glow", GLOW_CACHE), ("text", TEXT_CACHE)):
+            total = cache.hits + cache.misses
+            lines.append(f"{label} cache {cache.hits / total * 100 if total else 0.0:5.1f}% hit of {total}")
+        if self.message:
+            lines.append(self.message)
+
+        graph_h = 60
+        width = 360
+        panel = pygame.Surface((width, 16 + graph_h + 18 * len(lines)))
+        panel.fill((6, 8, 18))
+        pygame.draw.rect(panel, (90, 110, 170), panel.get_rect(), 1)
+        for i, ms in enumerate(self.frame_times):
+            h = min(graph_h, int(ms / self.GRAPH_MS * graph_h))
+            color = (90, 220, 120) if ms <= 1000.0 / FPS + 1.0 else (240, 200, 80) if ms <= self.GRAPH_MS else (240, 90, 90)
+            x = width - 8 - len(self.frame_times) + i
+            pygame.draw.line(panel, color, (x, 8 + graph_h), (x, 8 + graph_h - h))
+        budget_y = 8 + graph_h - int(1000.0 / FPS / self.GRAPH_MS * graph_h)
+        pygame.draw.line(panel, (120, 140, 200), (8, budget_y), (width - 8, budget_y))
+        for i, line in enumerate(lines):
+            panel.blit(self.font.render(line, True, (200, 220, 255)), (10, 16 + graph_h + i * 18))
+        self.panel = panel
+
+    def draw(self, surface):
+        """Blit the overlay; its text and graph are rebuilt six times a second."""
+        if self.panel is None or self.frames % 10 == 0:
+            self.build_panel()
+        surface.blit(self.panel, (surface.get_width() - self.panel.get_width() - 12, 12))
+        return pygame.Rect(surface.get_width() - self.panel.get_width() - 12, 12, *self.panel.get_size())
+
+
+QUALITY_TIERS = (
+    # (fx_level, particle budget, glow scale, chroma/flash, back parallax layers)
+    ("Low", 0.25, 0.6, False, 2),
+    ("Low", 0.5, 0.8, False, 3),
+    ("Low", 1.0, 1.0, True, 5),
+    ("Medium", 1.0, 1.0, True, 5),
+    ("High", 1.0, 1.0, True, 5),
+)
+
+
+class QualityGovernor:
+    """Steps render quality down when frames run over budget and back up when there is headroom.
+
+    Samples are the work time of each frame (FramePacer.work_ms, which
+    excludes the frame-cap sleep). Every full window is judged by its 90th
+    percentile: one slow window drops a tier, while climbing needs several
+    calm windows in a row, so quality does not oscillate around the
+    threshold. The manual fx_level picks the highest tier allowed.
+    """
+
+    WINDOW = 90
+    SLOW = 0.9
+    CALM = 0.55
+    CALM_WINDOWS = 3
+
+    def __init__(self, fx_level="High", fps=FPS):
+        self.budget_ms = 1000.0 / fps
+        self.samples = deque(maxlen=self.WINDOW)
+        self.calm = 0
+        self.set_ceiling(fx_level)
+        self.tier = self.ceiling
+
+    @property
+    def level(self):
+        return QUALITY_TIERS[self.tier][0]
+
+    def set_ceiling(self, fx_level):
+        self.ceiling = max(i for i, tier in enumerate(QUALITY_TIERS) if tier[0] == fx_level)
+        self.tier = self.ceiling
+        self.samples.clear()
+        self.calm = 0
+
+    def sample(self, work_ms):
+        """Record one frame; return True when the tier changed."""
+        self.samples.append(work_ms)
+        if len(self.samples) < self.WINDOW:
+            return False
+        slow = sorted(self.samples)[int(self.WINDOW * 0.9)]
+        self.samples.clear()
+        if slow > self.budget_ms * self.SLOW and self.tier > 0:
+            self.tier -= 1
+            self.calm = 0
+            return True
+        if slow < self.budget_ms * self.CALM and self.tier < self.ceiling:
+            self.calm += 1
+            if self.calm >= self.CALM_WINDOWS:
+                self.tier += 1
+                self.calm = 0
+                return True
+            return False
+        self.calm = 0
+        return False
+
+    def apply(self, fx, scenery):
+        fx_level, budget, glow_scale, post_fx, layers = QUALITY_TIERS[self.tier]
+        fx.level = fx_level
+        fx.post_fx = post_fx
+        if not post_fx:
+            fx.chroma_time = 0.0
+            fx.flash_time = 0.0
+        fx.particles.limit = max(1, int(fx.particles.capacity * budget))
+        GLOW_CACHE.scale = glow_scale
+        WIZARD_SPRITES.set_fx_level(fx_level)
+        scenery.set_detail(layers)
+
+
+INPUT_POLL_INTERVAL = 0.001
+
+
+class FramePacer:
+    """Caps the frame rate and timestamps input events on the perf_counter() clock.
+
+    An event is stamped with the time of the poll before the one that
+    returned it, the earliest moment it can have happened. main() polls
+    after the update, between render stages and before presenting, so
+    presses during a long frame get distinct stamps. By default the wait
+    polls once, after Clock.tick() sleeps. low_latency instead
+    sleeps out the frame budget in INPUT_POLL_INTERVAL slices and polls
+    between them, so stamps are good to about a millisecond. A key or button
+    press also pulls the deadline in to next_step, the wall-clock time the
+    next fixed simulation step falls due (None outside a run, meaning now),
+    so it reaches the screen on that step instead of at the next frame.
+    """
+
+    WAKE_EVENTS = (pygame.KEYDOWN, pygame.MOUSEBUTTONDOWN)
+
+    def __init__(self, fps=FPS, low_latency=False):
+        self.fps = fps
+        self.low_latency = low_latency
+        self.budget = 1.0 / fps
+        self.clock = pygame.time.Clock()
+        self.now = time.perf_counter()
+        self.deadline = self.now
+        self.last_poll = self.now
+        self.work_ms = 0.0
+        self.next_step = None
+        self.pending = []
+
+    def poll(self):
+        """Queue every waiting event; return True if one of them is a press."""
+        stamp = self.last_poll
+        self.last_poll = time.perf_counter()
+        events = pygame.event.get()
+        self.pending.extend((stamp, event) for event in events)
+        return any(event.type in self.WAKE_EVENTS for event in events)
+
+    def tick(self):
+        """Wait until the next frame is due; return the seconds since the previous one."""
+        started = time.perf_counter()
+        self.work_ms = (started - self.now) * 1000.0
+        if self.low_latency:
+            # A late frame moves the schedule instead of rushing the next ones to catch up.
+            self.deadline = max(self.deadline + self.budget, started)
+            while True:
+                if self.poll():
+                    self.deadline = min(self.deadline, self.next_step or 0.0)
+                remaining = self.deadline - time.perf_counter()
+                if remaining <= 0.0:
+                    break
+                time.sleep(min(remaining, INPUT_POLL_INTERVAL))
+        else:
+            self.clock.tick(self.fps)
+        previous, self.now = self.now, time.perf_counter()
+        return self.now - previous
+
+    def events(self):
+        """Return every (stamp, event) since the last call, oldest first."""
+        self.poll()
+        events, self.pending = self.pending, []
+        return events
+
+
+def main(mesh_wizard=False, render_scale=1.0, resizable=False, low_latency=False):
     pygame.init()
     pygame.display.set_caption("Wizard Rush 2D - Pygame")
-    screen = pygame.display.set_mode((WIDTH, HEIGHT))
-    clock = pygame.time.Clock()
-
-    title_font = pygame.font.SysFont("georgia", 72, bold=True)
-    h1_font = pygame.font.SysFont("georgia", 42, bold=True)
-    body_font = pygame.font.SysFont("segoeui", 28)
-    small_font = pygame.font.SysFont("segoeui", 22)
-
-    stars = [(random.randint(0, WIDTH), random.randint(20, 360), random.randint(1, 3)) for _ in range(80)]
-    hills_back = [{"x": i * 180, "h": random.randint(120, 220)} for i in range(10)]
-    hills_mid = [{"x": i * 170, "h": random.randint(170, 280)} for i in range(10)]
-    castle_spires = [{"x": i * 240 + 100, "w": random.randint(36, 66), "h": random.randint(170, 310)} for i in range(7)]
-    clouds_far = [{"x": i * 260, "y": random.randint(85, 200), "w": random.randint(150, 260)} for i in range(8)]
-    fog_bands = [{"x": i * 300, "y": random.randint(400, 560), "w": random.randint(220, 340)} for i in range(7)]
-    lane_marks = [i * 90 for i in range(20)]
-    runes = [i * 150 for i in range(14)]
+    # SCALED keeps the game drawing at WIDTH x HEIGHT and lets SDL stretch the
+    # finished frame to whatever size the window is given.
+    screen = pygame.display.set_mode((WIDTH, HEIGHT), (pygame.SCALED | pygame.RESIZABLE) if resizable else 0)
+    pacer = FramePacer(FPS, low_latency)
+    renderer = Renderer(screen, render_scale=render_scale)
 
     state = STATE_MENU
     prev_state = STATE_MENU
     difficulty = "Normal"
     fx_level = "High"
-
-    speed_profile = {
-        "Easy": (360, 1.25),
-        "Normal": (470, 1.0),
-        "Hard": (580, 0.82),
-    }
-    speed, spawn_interval = speed_profile[difficulty]
-
-    player_y = GROUND_Y
-    player_vel_y = 0.0
-    gravity = 1500.0
-    jump_force = 690.0
-    long_jump_window = 0.28
-    long_jump_active = 0.0
-    last_space_time = -10.0
-    score = 0.0
-    best = 0
+    governor = QualityGovernor(fx_level)
+
+    fx = Effects(fx_level)
+    governor.apply(fx, renderer.scenery)
+    profiler = Profiler()
+    disk = DiskCache()
+    if mesh_wizard:
+        WIZARD_SPRITES.use_mesh(Mesh.load(WIZARD_MESH_PATH, disk))
+    loader = AssetLoader(renderer, disk)
+    loader.start()
+    world = World(difficulty, fx=fx)
+    stats = RunStats().load()
+    stats.start()
     frame = 0.0
-    spawn_timer = 0.0
-    obstacles = []
-    particles = []
-    shake_time = 0.0
-    shake_power = 0.0
-    chroma_time = 0.0
-    flash_time = 0.0
+    accumulator = 0.0
+
+    replay = Replay(0, difficulty)
+    # Jumps and casts wait here as (stamp, action) until the simulation step their stamp falls in.
+    pending_inputs = deque()
+    applied_stamps = []
 
     def reset_run():
-        nonlocal player_y, player_vel_y, score, spawn_timer, frame, obstacles, particles, long_jump_active, last_space_time
-        nonlocal shake_time, shake_power, chroma_time, flash_time
-        player_y = GROUND_Y
-        player_vel_y = 0.0
-        score = 0.0
-        spawn_timer = 0.0
+        nonlocal frame, accumulator, replay
         frame = 0.0
-        long_jump_active = 0.0
-        last_space_time = -10.0
-        shake_time = 0.0
-        shake_power = 0.0
-        chroma_time = 0.0
-        flash_time = 0.0
-        obstacles.clear()
-        particles.clear()
+        accumulator = 0.0
+        seed = random.randrange(1 << 32)
+        world.reset(seed=seed)
+        replay = Replay(seed, difficulty)
+        pending_inputs.clear()
+        fx.clear()
+
+    def apply_pending(until=math.inf):
+        while pending_inputs and pending_inputs[0][0] <= until:
+            stamp, action = pending_inputs.popleft()
+            replay.record(world.steps, REPLAY_JUMP if action == INPUT_JUMP else REPLAY_CAST)
+            apply_input(world, action)
+            applied_stamps.append(stamp)
 
     def start_game():
         nonlocal state
         reset_run()
         state = STATE_PLAYING
 
+    def quit_game():
+        stats.close()
+        pygame.quit()
+        sys.exit(0)
+
     def go_menu():
         nonlocal state
         reset_run()
@@ -199,20 +2712,27 @@ def main():
         state = prev_state
 
     def cycle_difficulty():
-        nonlocal difficulty, speed, spawn_interval
+        nonlocal difficulty
         options = ["Easy", "Normal", "Hard"]
         difficulty = options[(options.index(difficulty) + 1) % len(options)]
-        speed, spawn_interval = speed_profile[difficulty]
+        world.set_difficulty(difficulty)
+        replay.record(world.steps, REPLAY_DIFFICULTY, DIFFICULTIES.index(difficulty))
 
     def cycle_fx():
         nonlocal fx_level
         options = ["Low", "Medium", "High"]
         fx_level = options[(options.index(fx_level) + 1) % len(options)]
+        governor.set_ceiling(fx_level)
+        governor.apply(fx, renderer.scenery)
+
+    def cycle_render_scale():
+        scales = RENDER_SCALES
+        renderer.set_render_scale(scales[(scales.index(renderer.render_scale) + 1) % len(scales)])
 
     menu_buttons = [
         Button(WIDTH // 2 - 140, 360, 280, 62, "Start Run", start_game),
         Button(WIDTH // 2 - 140, 436, 280, 62, "Settings", lambda: open_settings(STATE_MENU)),
-        Button(WIDTH // 2 - 140, 512, 280, 62, "Quit", lambda: sys.exit(0)),
+        Button(WIDTH // 2 - 140, 512, 280, 62, "Quit", quit_game),
     ]
     pause_buttons = [
         Button(WIDTH // 2 - 140, 360, 280, 62, "Resume", lambda: set_state(STATE_PLAYING)),
@@ -224,431 +2744,177 @@ def main():
         Button(WIDTH // 2 - 140, 496, 280, 62, "Main Menu", go_menu),
     ]
     settings_buttons = [
-        Button(WIDTH // 2 - 170, 350, 340, 62, "", cycle_difficulty),
-        Button(WIDTH // 2 - 170, 430, 340, 62, "", cycle_fx),
+        Button(WIDTH // 2 - 170, 300, 340, 62, "", cycle_difficulty),
+        Button(WIDTH // 2 - 170, 372, 340, 62, "", cycle_fx),
+        Button(WIDTH // 2 - 170, 444, 340, 62, "", cycle_render_scale),
         Button(WIDTH // 2 - 170, 520, 340, 62, "Back", close_settings),
     ]
 
     def set_state(new_state):
         nonlocal state
+        if state == STATE_PLAYING and new_state == STATE_PAUSED:
+            apply_pending()
+            replay.record(world.steps, REPLAY_PAUSE)
+        elif state == STATE_PAUSED and new_state == STATE_PLAYING:
+            replay.record(world.steps, REPLAY_RESUME)
         state = new_state
 
-    def spawn_particle(x, y, vx, vy, life, size, color, gravity=430.0, drag=0.0):
-        particles.append(
-            {
-                "x": x,
-                "y": y,
-                "vx": vx,
-                "vy": vy,
-                "life": life,
-                "max_life": life,
-                "size": size,
-                "color": color,
-                "gravity": gravity,
-                "drag": drag,
-            }
-        )
-
-    def emit_dust(x, y, count, tint=(180, 205, 230)):
-        for _ in range(count):
-            spawn_particle(
-                x + random.uniform(-16, 16),
-                y + random.uniform(-4, 3),
-                random.uniform(-120, 95),
-                random.uniform(-140, -40),
-                random.uniform(0.2, 0.38),
-                random.randint(2, 5),
-                tint,
-                gravity=340,
-                drag=1.6,
-            )
-
-    def emit_sparks(x, y, count, tint=(130, 245, 255)):
-        for _ in range(count):
-            spawn_particle(
-                x + random.uniform(-10, 10),
-                y + random.uniform(-10, 10),
-                random.uniform(-170, 170),
-                random.uniform(-240, -50),
-                random.uniform(0.22, 0.5),
-                random.randint(2, 6),
-                tint,
-                gravity=420,
-                drag=0.45,
-            )
+    def draw_hud():
+        renderer.draw_hud(world.score, stats.best[difficulty])
 
-    def emit_hit_burst(x, y, count, tint):
-        for _ in range(count):
-            spawn_particle(
-                x,
-                y,
-                random.uniform(-260, 260),
-                random.uniform(-320, 110),
-                random.uniform(0.3, 0.7),
-                random.randint(3, 8),
-                tint,
-                gravity=520,
-                drag=0.25,
-            )
-
-    def trigger_impact_vfx(x, y, tint=(255, 140, 140), power=1.0):
-        nonlocal shake_time, shake_power, chroma_time, flash_time
-        shake_time = max(shake_time, 0.22 * power)
-        shake_power = max(shake_power, 11.0 * power)
-        chroma_time = max(chroma_time, 0.16 * power)
-        flash_time = max(flash_time, 0.1 * power)
-        emit_hit_burst(x, y, int(16 * power), tint)
-
-    def spawn_obstacle():
-        kind = "wall" if random.random() < 0.28 else "hurdle"
-        if kind == "wall":
-            h = random.randint(230, 300)
-            w = random.randint(74, 96)
-            y = GROUND_Y + 60 - h
-        else:
-            h = random.randint(70, 165)
-            w = random.randint(45, 75)
-            y = GROUND_Y + 60 - h
-
-        rect = pygame.Rect(WIDTH + 30, y, w, h)
-        obstacles.append({"rect": rect, "kind": kind, "phase": random.uniform(0, 6.28)})
-
-    def cast_spell():
-        if not obstacles:
-            return
-        target = None
-        for o in obstacles:
-            if o["rect"].centerx > PLAYER_X:
-                target = o
-                break
-        if not target:
-            return
-        wx = PLAYER_X + 42
-        wy = int(player_y) - 18
-        tx = target["rect"].centerx
-        ty = target["rect"].centery
-        for i in range(10):
-            t = i / 9
-            sx = wx + (tx - wx) * t + random.uniform(-3, 3)
-            sy = wy + (ty - wy) * t + random.uniform(-3, 3)
-            emit_sparks(sx, sy, 1, (138, 246, 255) if target["kind"] == "hurdle" else (192, 152, 255))
-        emit_hit_burst(tx, ty, 12, (130, 245, 255) if target["kind"] == "hurdle" else (198, 160, 255))
-        if target["kind"] == "wall":
-            trigger_impact_vfx(tx, ty, (205, 170, 255), 0.8)
-        obstacles.remove(target)
+    def ui_screen():
+        """Panel title, subtitle and buttons for the current non-playing state."""
+        if state == STATE_MENU:
+            return "WIZARD RUSH", "Press ENTER/SPACE or click Start", menu_buttons
+        if state == STATE_PAUSED:
+            return "PAUSED", "Press ESC to resume quickly", pause_buttons
+        if state == STATE_SETTINGS:
+            settings_buttons[0].label = f"Difficulty: {difficulty}"
+            auto = f" (auto {governor.level})" if governor.tier < governor.ceiling else ""
+            settings_buttons[1].label = f"Effects: {fx_level}{auto}"
+            settings_buttons[2].label = f"Render Scale: {renderer.render_scale:.0%}"
+            return "SETTINGS", "Tune challenge and visuals", settings_buttons
+        return "GAME OVER", f"Final Score: {int(world.score)}", game_over_buttons
 
     while True:
-        dt = clock.tick(FPS) / 1000.0
+        profiler.next_frame(world, fx, renderer)
+        with profiler.section("wait"):
+            dt = min(pacer.tick(), MAX_FRAME_TIME)
         frame += 1
+        loader.poll()
+        if state == STATE_PLAYING and governor.sample(pacer.work_ms):
+            governor.apply(fx, renderer.scenery)
         mouse_pos = pygame.mouse.get_pos()
 
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                sys.exit(0)
-
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_ESCAPE:
-                    if state == STATE_PLAYING:
-                        set_state(STATE_PAUSED)
+        with profiler.section("events"):
+            for stamp, event in pacer.events():
+                if event.type == pygame.QUIT:
+                    quit_game()
+
+                if event.type == pygame.WINDOWEXPOSED:
+                    renderer.invalidate()
+
+                if event.type == pygame.KEYDOWN:
+                    if event.key == pygame.K_ESCAPE:
+                        if state == STATE_PLAYING:
+                            set_state(STATE_PAUSED)
+                        elif state == STATE_PAUSED:
+                            set_state(STATE_PLAYING)
+                        elif state == STATE_SETTINGS:
+                            close_settings()
+                    elif event.key == pygame.K_RETURN and state == STATE_MENU:
+                        start_game()
+                    elif event.key == pygame.K_r and state in (STATE_PLAYING, STATE_PAUSED, STATE_GAME_OVER):
+                        start_game()
+                    elif event.key in (pygame.K_SPACE, pygame.K_UP):
+                        if state == STATE_MENU:
+                            start_game()
+                        elif state == STATE_PLAYING:
+                            pending_inputs.append((stamp, INPUT_JUMP))
+                    elif event.key == pygame.K_e and state == STATE_PLAYING:
+                        pending_inputs.append((stamp, INPUT_CAST))
+                    elif event.key == pygame.K_F3:
+                        profiler.toggle()
+                        renderer.invalidate()
+                    elif event.key == pygame.K_F4 and profiler.enabled:
+                        profiler.export()
+
+                if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+                    if state == STATE_MENU:
+                        for b in menu_buttons:
+                            if b.click(event.pos):
+                                break
                     elif state == STATE_PAUSED:
-                        set_state(STATE_PLAYING)
+                        for b in pause_buttons:
+                            if b.click(event.pos):
+                                break
+                    elif state == STATE_GAME_OVER:
+                        for b in game_over_buttons:
+                            if b.click(event.pos):
+                                break
                     elif state == STATE_SETTINGS:
-                        close_settings()
-                elif event.key == pygame.K_RETURN and state == STATE_MENU:
-                    start_game()
-                elif event.key == pygame.K_r and state in (STATE_PLAYING, STATE_PAUSED, STATE_GAME_OVER):
-                    start_game()
-                elif event.key in (pygame.K_SPACE, pygame.K_UP):
-                    if state == STATE_MENU:
-                        start_game()
-                    elif state == STATE_PLAYING:
-                        now = pygame.time.get_ticks() / 1000.0
-                        grounded = player_y >= GROUND_Y - 0.1
-                        is_double_tap = (now - last_space_time) <= long_jump_window
-
-                        if grounded:
-                            if is_double_tap:
-                                player_vel_y = -(jump_force * 1.2)
-                                long_jump_active = 0.24
-                            else:
-                                player_vel_y = -jump_force
-                                long_jump_active = 0.0
-
-                            n = 4 if fx_level == "Low" else 7 if fx_level == "Medium" else 10
-                            emit_dust(PLAYER_X, GROUND_Y + 64, n, (215, 232, 255) if not is_double_tap else (250, 214, 120))
-                            if is_double_tap:
-                                trigger_impact_vfx(PLAYER_X, GROUND_Y + 52, (250, 214, 120), 0.55)
-                        elif is_double_tap and long_jump_active <= 0.0:
-                            player_vel_y = min(player_vel_y, -(jump_force * 0.55))
-                            long_jump_active = 0.2
-                            emit_sparks(PLAYER_X + 24, player_y + 14, 10, (246, 225, 128))
-
-                        last_space_time = now
-                elif event.key == pygame.K_e and state == STATE_PLAYING:
-                    cast_spell()
-
-            if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
-                if state == STATE_MENU:
-                    for b in menu_buttons:
-                        if b.click(event.pos):
-                            break
-                elif state == STATE_PAUSED:
-                    for b in pause_buttons:
-                        if b.click(event.pos):
-                            break
-                elif state == STATE_GAME_OVER:
-                    for b in game_over_buttons:
-                        if b.click(event.pos):
-                            break
-                elif state == STATE_SETTINGS:
-                    for b in settings_buttons:
-                        if b.click(event.pos):
-                            break
+                        for b in settings_buttons:
+                            if b.click(event.pos):
+                                break
 
         # Update
-        if state == STATE_PLAYING:
-            if shake_time > 0.0:
-                shake_time = max(0.0, shake_time - dt)
-            if chroma_time > 0.0:
-                chroma_time = max(0.0, chroma_time - dt)
-            if flash_time > 0.0:
-                flash_time = max(0.0, flash_time - dt)
-
-            effective_gravity = gravity * (0.58 if long_jump_active > 0.0 else 1.0)
-            if long_jump_active > 0.0:
-                long_jump_active = max(0.0, long_jump_active - dt)
-            player_vel_y += effective_gravity * dt
-            player_y += player_vel_y * dt
-            if player_y > GROUND_Y:
-                player_y = GROUND_Y
-                player_vel_y = 0.0
-
-            score += dt * (11 + speed * 0.035)
-            spawn_timer += dt
-            if spawn_timer >= spawn_interval:
-                spawn_timer = 0.0
-                spawn_obstacle()
-
-            # world scroll
-            for h in hills_back:
-                h["x"] -= speed * 0.18 * dt
-                if h["x"] < -220:
-                    h["x"] += 180 * len(hills_back)
-            for h in hills_mid:
-                h["x"] -= speed * 0.34 * dt
-                if h["x"] < -220:
-                    h["x"] += 170 * len(hills_mid)
-            for s in castle_spires:
-                s["x"] -= speed * 0.28 * dt
-                if s["x"] < -140:
-                    s["x"] += 240 * len(castle_spires)
-            for c in clouds_far:
-                c["x"] -= speed * 0.09 * dt
-                if c["x"] < -300:
-                    c["x"] += 260 * len(clouds_far)
-            for f in fog_bands:
-                f["x"] -= speed * 0.24 * dt
-                if f["x"] < -360:
-                    f["x"] += 300 * len(fog_bands)
-            for i, x in enumerate(lane_marks):
-                lane_marks[i] = x - speed * 0.95 * dt
-                if lane_marks[i] < -120:
-                    lane_marks[i] += 1800
-            for i, x in enumerate(runes):
-                runes[i] = x - speed * 0.72 * dt
-                if runes[i] < -170:
-                    runes[i] += 2200
-
-            player_hitbox = pygame.Rect(PLAYER_X - 28, int(player_y) - 106, 56, 132)
-            for o in list(obstacles):
-                rect = o["rect"]
-                rect.x -= int(speed * dt)
-                o["phase"] += dt * 3.2
-                if rect.right < -40:
-                    obstacles.remove(o)
-                    continue
-                if player_hitbox.colliderect(rect):
-                    best = max(best, int(score))
-                    state = STATE_GAME_OVER
-                    tint = (255, 130, 130) if o["kind"] == "hurdle" else (196, 138, 255)
-                    trigger_impact_vfx(player_hitbox.centerx, player_hitbox.centery, tint, 1.3)
-                    break
-
-            if fx_level != "Low" and random.random() < (0.11 if fx_level == "Medium" else 0.19):
-                emit_sparks(PLAYER_X + 42, int(player_y) - 26, 1, (130, 245, 255))
-            if player_y >= GROUND_Y - 0.1 and random.random() < (0.08 if fx_level == "Low" else 0.14):
-                emit_dust(PLAYER_X - 8, GROUND_Y + 64, 1, (164, 184, 206))
-
-        for p in list(particles):
-            if "max_life" not in p:
-                p["max_life"] = p["life"]
-                p["gravity"] = p.get("gravity", 430.0)
-                p["drag"] = p.get("drag", 0.0)
-            p["life"] -= dt
-            p["vx"] *= max(0.0, 1.0 - p.get("drag", 0.0) * dt)
-            p["x"] += p["vx"] * dt
-            p["y"] += p["vy"] * dt
-            p["vy"] += p.get("gravity", 430.0) * dt
-            if p["life"] <= 0:
-                particles.remove(p)
+        with profiler.section("update"):
+            if state == STATE_PLAYING:
+                fx.update_timers(dt)
+                accumulator += dt
+                # Wall-clock time the world's current state stands for.
+                sim_clock = pacer.now - accumulator
+                while accumulator >= SIM_DT:
+                    sim_clock += SIM_DT
+                    apply_pending(sim_clock)
+                    world.step(SIM_DT)
+                    accumulator -= SIM_DT
+                    if not world.alive:
+                        stats.record(world, difficulty, replay.seed)
+                        replay.finish(world)
+                        replay.save_in_background(os.path.join(REPLAY_DIR, "last_run.wrr"))
+                        state = STATE_GAME_OVER
+                        accumulator = SIM_DT
+                        break
+            pacer.next_step = pacer.now - accumulator + SIM_DT if state == STATE_PLAYING else None
+
+            fx.particles.update(dt)
+        # Presses that arrive while this frame is worked on are stamped at
+        # these stage boundaries, so a long frame keeps them apart.
+        pacer.poll()
 
         # Draw
-        draw_vertical_gradient(screen, (11, 16, 44), (42, 28, 66))
-        draw_soft_glow(screen, (1080, 105), 124, (140, 195, 255), 120)
-        pygame.draw.circle(screen, (232, 245, 255), (1080, 105), 56)
-        pygame.draw.circle(screen, (138, 185, 255), (1080, 105), 84, 2)
-        pygame.draw.rect(screen, (255, 136, 92), (0, 250, WIDTH, 180), border_radius=0)
-        overlay = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
-        overlay.fill((12, 16, 38, 168))
-        screen.blit(overlay, (0, 0))
-
-        for sx, sy, sr in stars:
-            alpha = 120 + int((math.sin((frame + sx) * 0.02) + 1) * 60)
-            pygame.draw.circle(screen, (220, 235, 255, alpha), (sx, sy), sr)
-
-        for c in clouds_far:
-            cx, cy, w = int(c["x"]), c["y"], c["w"]
-            pygame.draw.ellipse(screen, (120, 132, 178), (cx, cy, w, 42))
-            pygame.draw.ellipse(screen, (106, 120, 164), (cx + 38, cy - 18, w - 52, 40))
-
-        for h in hills_back:
-            pygame.draw.rect(screen, (44, 52, 90), (h["x"], HEIGHT - 270 - h["h"], 220, h["h"]), border_radius=24)
-        for h in hills_mid:
-            pygame.draw.rect(screen, (62, 66, 102), (h["x"], HEIGHT - 235 - h["h"], 220, h["h"]), border_radius=22)
-        for s in castle_spires:
-            sx = int(s["x"])
-            spire_body = pygame.Rect(sx, HEIGHT - 238 - s["h"], s["w"], s["h"])
-            pygame.draw.rect(screen, (48, 44, 70), spire_body, border_radius=6)
-            roof = [(sx + s["w"] // 2, spire_body.y - 28), (sx - 8, spire_body.y + 4), (sx + s["w"] + 8, spire_body.y + 4)]
-            pygame.draw.polygon(screen, (34, 30, 52), roof)
-            window_y = spire_body.y + 28
-            while window_y < spire_body.bottom - 18:
-                pygame.draw.rect(screen, (232, 194, 122), (sx + s["w"] // 2 - 3, window_y, 6, 10), border_radius=2)
-                window_y += 26
-
-        for f in fog_bands:
-            fx, fy, fw = int(f["x"]), f["y"], f["w"]
-            pygame.draw.ellipse(screen, (98, 128, 170), (fx, fy, fw, 80))
-
-        pygame.draw.rect(screen, (34, 36, 56), (0, GROUND_Y + 52, WIDTH, 180))
-        pygame.draw.rect(screen, (82, 174, 235), (0, GROUND_Y + 48, WIDTH, 6))
-        pygame.draw.rect(screen, (44, 54, 78), (0, GROUND_Y + 124, WIDTH, 98))
-        for x in lane_marks:
-            pygame.draw.rect(screen, (190, 220, 255), (int(x), GROUND_Y + 88, 54, 8), border_radius=4)
-        for x in runes:
-            pygame.draw.polygon(
-                screen,
-                (120, 220, 255),
-                [(int(x), GROUND_Y + 56), (int(x + 10), GROUND_Y + 46), (int(x + 20), GROUND_Y + 56), (int(x + 10), GROUND_Y + 66)],
-            )
-
-        for o in obstacles:
-            rect = o["rect"]
-            if o["kind"] == "wall":
-                aura = (148, 110, 246)
-                body = (76, 46, 122)
-                trim = (198, 164, 255)
-                symbol = (238, 220, 255)
+        with profiler.section("draw"):
+            if state == STATE_PLAYING:
+                renderer.render_frame(world, fx, accumulator / SIM_DT, frame, draw_hud, profiler.timings, between_stages=pacer.poll)
+                dirty = None
             else:
-                aura = (220, 80, 120)
-                body = (118, 42, 62)
-                trim = (190, 80, 110)
-                symbol = (245, 120, 150)
-
-            draw_soft_glow(screen, rect.center, max(rect.width, rect.height), aura, 30)
-            pygame.draw.rect(screen, body, rect, border_radius=8)
-            pygame.draw.rect(screen, tuple(min(255, c + 30) for c in body), (rect.x + 6, rect.y + 8, max(4, rect.w - 12), max(4, rect.h - 12)), border_radius=6)
-            pygame.draw.rect(screen, trim, rect, 2, border_radius=8)
-            pulse_r = max(5, rect.w // 8) + int((math.sin(o["phase"]) + 1.0) * 2)
-            pygame.draw.circle(screen, symbol, rect.center, pulse_r, 1)
-
-        draw_wizard(screen, PLAYER_X, player_y, frame, player_y < GROUND_Y - 0.1)
-
-        for p in particles:
-            life_ratio = clamp(p["life"] / max(0.001, p.get("max_life", p["life"])), 0.0, 1.0)
-            r = clamp(int(p["size"] * (0.4 + life_ratio * 1.5)), 1, 14)
-            alpha = int(40 + life_ratio * 215)
-            pygame.draw.circle(screen, (*p["color"], alpha), (int(p["x"]), int(p["y"])), r)
-
-        # HUD
-        if state == STATE_PLAYING:
-            draw_soft_glow(screen, (160, 74), 180, (95, 170, 255), 35)
-            pygame.draw.rect(screen, (10, 14, 36), (24, 20, 270, 110), border_radius=16)
-            pygame.draw.rect(screen, (128, 170, 255), (24, 20, 270, 110), 2, border_radius=16)
-            screen.blit(body_font.render(f"SCORE  {int(score)}", True, (210, 240, 255)), (42, 38))
-            screen.blit(small_font.render(f"BEST   {best}", True, (190, 206, 238)), (42, 75))
-            screen.blit(small_font.render("SPACE x2 long jump  E breaks cursed walls  ESC pause", True, (140, 220, 255)), (36, HEIGHT - 42))
-
-        def draw_center_panel(title, subtitle):
-            panel = pygame.Rect(WIDTH // 2 - 300, 170, 600, 390)
-            draw_soft_glow(screen, panel.center, 360, (84, 132, 255), 26)
-            pygame.draw.rect(screen, (8, 12, 28), panel, border_radius=22)
-            pygame.draw.rect(screen, (145, 180, 255), panel, 2, border_radius=22)
-            pygame.draw.rect(screen, (176, 208, 255), (panel.x + 12, panel.y + 14, panel.w - 24, 6), border_radius=3)
-            screen.blit(h1_font.render(title, True, (210, 226, 255)), (panel.centerx - h1_font.size(title)[0] // 2, panel.y + 30))
-            if subtitle:
-                screen.blit(small_font.render(subtitle, True, (165, 195, 235)), (panel.centerx - small_font.size(subtitle)[0] // 2, panel.y + 90))
-
-        if state == STATE_MENU:
-            draw_center_panel("WIZARD RUSH", "Press ENTER/SPACE or click Start")
-            for b in menu_buttons:
-                b.draw(screen, body_font, mouse_pos)
-
-        elif state == STATE_PAUSED:
-            draw_center_panel("PAUSED", "Press ESC to resume quickly")
-            for b in pause_buttons:
-                b.draw(screen, body_font, mouse_pos)
-
-        elif state == STATE_SETTINGS:
-            settings_buttons[0].label = f"Difficulty: {difficulty}"
-            settings_buttons[1].label = f"Effects: {fx_level}"
-            draw_center_panel("SETTINGS", "Tune challenge and visuals")
-            for b in settings_buttons:
-                b.draw(screen, body_font, mouse_pos)
-
-        elif state == STATE_GAME_OVER:
-            draw_center_panel("GAME OVER", f"Final Score: {int(score)}")
-            for b in game_over_buttons:
-                b.draw(screen, body_font, mouse_pos)
-
-        vignette = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
-        pygame.draw.rect(vignette, (0, 0, 0, 58), (0, 0, WIDTH, HEIGHT), width=110, border_radius=10)
-        screen.blit(vignette, (0, 0))
-
-        frame_img = screen.copy()
-        screen.fill((0, 0, 0))
-
-        shake_x = 0
-        shake_y = 0
-        if shake_time > 0.0:
-            decay = shake_time / 0.22
-            amount = shake_power * clamp(decay, 0.0, 1.0)
-            shake_x = int(random.uniform(-amount, amount))
-            shake_y = int(random.uniform(-amount * 0.7, amount * 0.7))
-            shake_power = max(0.0, shake_power * 0.92)
-
-        screen.blit(frame_img, (shake_x, shake_y))
-
-        if chroma_time > 0.0:
-            strength = clamp(chroma_time / 0.16, 0.0, 1.0)
-            offset = int(2 + strength * 4)
-            red_pass = frame_img.copy()
-            cyan_pass = frame_img.copy()
-            red_pass.fill((255, 90, 90, 255), special_flags=pygame.BLEND_RGBA_MULT)
-            cyan_pass.fill((110, 235, 255, 255), special_flags=pygame.BLEND_RGBA_MULT)
-            red_pass.set_alpha(int(65 * strength))
-            cyan_pass.set_alpha(int(65 * strength))
-            screen.blit(red_pass, (shake_x + offset, shake_y))
-            screen.blit(cyan_pass, (shake_x - offset, shake_y))
-
-        if flash_time > 0.0:
-            white = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
-            white.fill((240, 245, 255, int(130 * clamp(flash_time / 0.1, 0.0, 1.0))))
-            screen.blit(white, (0, 0))
-
-        pygame.display.flip()
+                title, subtitle, buttons = ui_screen()
+                dirty = renderer.render_ui(world, fx, accumulator / SIM_DT, frame, title, subtitle, buttons, mouse_pos, profiler.timings)
+        if profiler.enabled:
+            with profiler.section("overlay"):
+                overlay = profiler.draw(screen)
+            if dirty is not None:
+                dirty.append(overlay)
+        pacer.poll()
+        with profiler.section("present"):
+            if dirty is None:
+                pygame.display.flip()
+            elif dirty:
+                pygame.display.update(dirty)
+        if applied_stamps:
+            profiler.record_latency(applied_stamps, time.perf_counter())
+            applied_stamps.clear()
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Wizard Rush, a wizard-themed endless runner.")
+    parser.add_argument("--replay", metavar="PATH", help="play a recorded run headless and check it reproduces")
+    parser.add_argument("--stats", action="store_true", help="print the per-difficulty run statistics")
+    parser.add_argument("--mesh-wizard", action="store_true", help="draw the wizard from assets/wizard_runner.obj")
+    parser.add_argument("--render-scale", type=int, default=100, choices=[round(s * 100) for s in RENDER_SCALES], help="world resolution in percent")
+    parser.add_argument("--resizable", action="store_true", help="open a resizable window")
+    parser.add_argument("--low-latency", action="store_true", help="poll input while waiting for the next frame")
+    args = parser.parse_args()
+
+    if args.replay:
+        try:
+            recorded = Replay.load(args.replay)
+        except (OSError, ValueError) as exc:
+            parser.error(f"argument --replay: {exc}")
+        result = play_replay(recorded)
+        match = result.score == recorded.score and result.steps == recorded.end_step
+        print(f"score {int(result.score)} after {result.steps} steps ({'matches' if match else 'DIFFERS from'} recording)")
+        sys.exit(0 if match else 1)
+    if args.stats:
+        columns = ("difficulty", "runs", "best", "mean_score", "mean_survived", "hurdle_deaths", "wall_deaths", "spells_cast")
+        print("  ".join(f"{name:>13}" for name in columns))
+        for row in RunStats().summary():
+            print("  ".join(f"{row[name]:>13.1f}" if isinstance(row[name], float) else f"{row[name]:>13}" for name in columns))
+        sys.exit(0)
+    main(
+        mesh_wizard=args.mesh_wizard,
+        render_scale=args.render_scale / 100,
+        resizable=args.resizable,
+        low_latency=args.low_latency,
+    )